@@ -0,0 +1,40 @@
+"""stand-in for a paho client that acknowledges every message immediately"""
+import threading
+
+MQTT_ERR_SUCCESS = 0
+
+class FakeMessageInfo:
+    """the MQTTMessageInfo of a message that is already delivered"""
+    def __init__(self, mid):
+        self.mid = mid
+        self.rc = MQTT_ERR_SUCCESS
+
+    def is_published(self):
+        """always delivered"""
+        return True
+
+    def wait_for_publish(self, timeout=None):
+        """nothing to wait for"""
+        return None
+
+class FakeClient:
+    """counts the published messages and bytes instead of sending them"""
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        """count a message"""
+        size = len(topic) + (len(payload) if isinstance(payload, (str, bytes)) else 0)
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+            mid = self.messages
+        return FakeMessageInfo(mid)
+
+    def reset(self):
+        """start counting from zero"""
+        with self._lock:
+            self.messages = 0
+            self.bytes = 0
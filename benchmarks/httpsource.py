@@ -0,0 +1,54 @@
+"""local HTTP server serving synthetic payloads"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from synthetic import CONTENT_TYPES
+
+class PayloadServer:
+    """serves /<format> with a fixed payload per format on a random local port"""
+    def __init__(self, payloads):
+        self.payloads = {data_format: payload.encode('utf-8')
+                         for data_format, payload in payloads.items()}
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """answers with the payload of the requested format"""
+            def do_GET(self):  # pylint: disable=invalid-name
+                """send a payload"""
+                data_format = self.path.strip('/')
+                body = server.payloads.get(data_format)
+                if body is None:
+                    self.send_error(404)
+                    return
+                server.requests += 1
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPES[data_format])
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                """keep the benchmark output clean"""
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        """the port the server listens on"""
+        return self.httpd.server_address[1]
+
+    def url(self, data_format):
+        """URL of the payload of a format"""
+        return f"http://127.0.0.1:{self.port}/{data_format}"
+
+    def start(self):
+        """serve on a background thread"""
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """shut the server down"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
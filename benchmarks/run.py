@@ -0,0 +1,216 @@
+"""benchmark of the data2mqtt pipeline against a local HTTP source and a fake MQTT client"""
+import _thread
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+# pylint: disable=wrong-import-position
+import yaml
+import data2mqtt
+import metrics
+import mqttpool
+from fakemqtt import FakeClient
+from httpsource import PayloadServer
+from synthetic import CONTENT_TYPES, make_document, make_payload
+
+FORMATS = list(CONTENT_TYPES)
+STAGES = ['fetch_seconds', 'parse_seconds', 'publish_seconds', 'run_seconds']
+
+def percentiles(samples):
+    """latency percentiles in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+    return {'p50_ms': pick(0.5), 'p90_ms': pick(0.9), 'p99_ms': pick(0.99),
+            'max_ms': ordered[-1] * 1000, 'count': len(ordered)}
+
+def peak_rss_mb():
+    """peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def measure(function, iterations):
+    """call function repeatedly, returns the duration of every call"""
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def summary(durations, client, payload_bytes=0):
+    """throughput and latency of a benchmark"""
+    total = sum(durations)
+    result = {
+        'seconds': total,
+        'messages': client.messages,
+        'messages_per_second': client.messages / total if total else 0,
+        'latency': percentiles(durations),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if payload_bytes:
+        result['parse_mb_per_second'] = payload_bytes * len(durations) / total / 1e6 \
+            if total else 0
+    return result
+
+def bench_process_json(args):
+    """flattening and publishing of an already parsed document"""
+    document = make_document(args.leaves, args.depth)
+    client = FakeClient()
+    state = data2mqtt.SourceState({'name': 'bench-process-json'})
+    durations = measure(lambda: data2mqtt.process_json(client, document, state=state),
+                        args.iterations)
+    return summary(durations, client)
+
+def bench_detect_and_process(args, data_format):
+    """format detection, parsing, flattening and publishing of a payload"""
+    payload = make_payload(data_format, args.leaves, args.depth)
+    client = FakeClient()
+    state = data2mqtt.SourceState({'name': f"bench-{data_format}"})
+    content_type = CONTENT_TYPES[data_format]
+    durations = measure(lambda: data2mqtt.detect_and_process_data(client, payload, content_type,
+                                                                  state=state),
+                        args.iterations)
+    return {'payload_bytes': len(payload.encode('utf-8')),
+            **summary(durations, client, len(payload.encode('utf-8')))}
+
+def record_stages():
+    """collect the raw observations of the stage histograms"""
+    samples = {stage: [] for stage in STAGES}
+    for stage in STAGES:
+        histogram = getattr(metrics, stage)
+        observe = histogram.observe
+
+        def recording_observe(value, _observe=observe, _samples=samples[stage], **labels):
+            _samples.append(value)
+            _observe(value, **labels)
+        histogram.observe = recording_observe
+    return samples
+
+def bench_main_loop(args):
+    """the complete main() loop fetching all formats from the local HTTP server"""
+    payloads = {data_format: make_payload(data_format, args.leaves, args.depth)
+                for data_format in args.formats}
+    server = PayloadServer(payloads).start()
+    client = FakeClient()
+    mqttpool.BrokerPool.get_client = lambda self, *_args, **_kwargs: client
+    stages = record_stages()
+    configurations = [{'name': f"bench-{data_format}", 'url': server.url(data_format),
+                       'interval': args.interval} for data_format in args.formats]
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as config_file:
+        yaml.safe_dump({'configurations': configurations}, config_file)
+    argv = sys.argv
+    # the temporary configuration file must not leave a pickle in the user's config cache
+    sys.argv = ['data2mqtt.py', '--configfile', config_file.name, '--engine', args.engine,
+                '--no-config-cache']
+    # stop main() the same way Ctrl-C does once the time is up
+    timer = threading.Timer(args.duration, _thread.interrupt_main)
+    start = time.perf_counter()
+    try:
+        timer.start()
+        data2mqtt.main()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        timer.cancel()
+        sys.argv = argv
+        server.stop()
+        os.unlink(config_file.name)
+    elapsed = time.perf_counter() - start
+    payload_bytes = sum(len(payload.encode('utf-8')) for payload in payloads.values())
+    return {
+        'seconds': elapsed,
+        'requests': server.requests,
+        'messages': client.messages,
+        'messages_per_second': client.messages / elapsed if elapsed else 0,
+        'fetched_mb_per_second': server.requests * payload_bytes / len(payloads) / elapsed / 1e6
+                                 if elapsed else 0,
+        'stages': {stage: percentiles(samples) for stage, samples in stages.items()},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def compare(results, baseline):
+    """print the change of the throughput against an earlier result file"""
+    for name, result in results['benchmarks'].items():
+        before = baseline.get('benchmarks', {}).get(name)
+        if not before or not before.get('messages_per_second'):
+            continue
+        change = result['messages_per_second'] / before['messages_per_second'] - 1
+        print(f"{name:32} {before['messages_per_second']:12.0f} -> " \
+              f"{result['messages_per_second']:12.0f} msgs/s ({change:+.1%})")
+
+def main():
+    """run the selected benchmarks and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--formats", type=lambda value: value.split(','),
+                        default=FORMATS, help="Comma-separated list of payload formats.")
+    parser.add_argument("--leaves", type=int, default=1000,
+                        help="Number of data points per payload.")
+    parser.add_argument("--depth", type=int, default=3, help="Nesting depth of the documents.")
+    parser.add_argument("--iterations", type=int, default=50,
+                        help="Runs of every in-process benchmark.")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="Seconds the main() loop runs, 0 to skip it.")
+    parser.add_argument("--interval", type=float, default=0.5,
+                        help="Interval of the configuration sets in the main() loop.")
+    parser.add_argument("--engine", default='threads', help="Execution engine of main().")
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, 'results'),
+                        help="Directory the JSON results are saved in.")
+    parser.add_argument("--compare", help="Earlier result file to compare with.")
+    args = parser.parse_args()
+
+    results = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parameters': {'leaves': args.leaves, 'depth': args.depth,
+                       'iterations': args.iterations},
+        'benchmarks': {},
+    }
+    benchmarks = results['benchmarks']
+    benchmarks['process_json'] = bench_process_json(args)
+    for data_format in args.formats:
+        benchmarks[f"detect_and_process_data[{data_format}]"] = \
+            bench_detect_and_process(args, data_format)
+    if args.duration:
+        benchmarks['main_loop'] = bench_main_loop(args)
+
+    for name, result in benchmarks.items():
+        line = f"{name:32} {result['messages_per_second']:12.0f} msgs/s"
+        if 'parse_mb_per_second' in result:
+            line += f" {result['parse_mb_per_second']:8.2f} MB/s"
+        if 'latency' in result:
+            line += f"  p50 {result['latency']['p50_ms']:.2f} ms" \
+                    f"  p99 {result['latency']['p99_ms']:.2f} ms"
+        print(line)
+    if 'main_loop' in benchmarks:
+        for stage, stats in benchmarks['main_loop']['stages'].items():
+            if stats:
+                print(f"  {stage:30} p50 {stats['p50_ms']:.2f} ms  p90 {stats['p90_ms']:.2f} ms" \
+                      f"  p99 {stats['p99_ms']:.2f} ms")
+    print(f"peak RSS {peak_rss_mb():.1f} MB")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {path}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""synthetic payloads of configurable size and nesting"""
+import json
+import math
+import random
+from xml.sax.saxutils import escape
+import yaml
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'xml': 'application/xml',
+    'yaml': 'application/x-yaml',
+    'csv': 'text/csv',
+}
+CSV_COLUMNS = 10
+
+def _leaf(rng, index):
+    """a value as found in typical sensor data"""
+    kind = index % 4
+    if kind == 0:
+        return round(rng.uniform(-20, 40), 2)
+    if kind == 1:
+        return rng.randint(0, 100000)
+    if kind == 2:
+        return rng.choice([True, False])
+    return f"state-{rng.randint(0, 9)}"
+
+def make_document(leaves, depth, seed=0):
+    """nested dict with about the given number of leaves spread over depth levels"""
+    rng = random.Random(seed)
+    depth = max(1, depth)
+    breadth = max(1, math.ceil(leaves ** (1 / depth)))
+    counter = [0]
+
+    def build(level):
+        node = {}
+        for index in range(breadth):
+            if counter[0] >= leaves:
+                break
+            if level == depth:
+                node[f"value{index}"] = _leaf(rng, counter[0])
+                counter[0] += 1
+            else:
+                node[f"node{index}"] = build(level + 1)
+        return node
+    return {'data': build(1)}
+
+def _to_xml(name, value, parts):
+    """append the XML of a value to parts"""
+    if isinstance(value, dict):
+        parts.append(f"<{name}>")
+        for key, child in value.items():
+            _to_xml(key, child, parts)
+        parts.append(f"</{name}>")
+    else:
+        parts.append(f"<{name}>{escape(str(value))}</{name}>")
+
+def to_xml(document):
+    """serialize a document with a single root key as XML"""
+    parts = ['<?xml version="1.0" encoding="utf-8"?>']
+    for key, value in document.items():
+        _to_xml(key, value, parts)
+    return "".join(parts)
+
+def make_csv(leaves, seed=0):
+    """CSV table with an id column and about the given number of cells"""
+    rng = random.Random(seed)
+    rows = max(1, leaves // CSV_COLUMNS)
+    lines = ["id," + ",".join(f"column{index}" for index in range(CSV_COLUMNS - 1))]
+    for row in range(rows):
+        cells = [str(_leaf(rng, index)) for index in range(CSV_COLUMNS - 1)]
+        lines.append(f"row{row}," + ",".join(cells))
+    return "\n".join(lines) + "\n"
+
+def make_payload(data_format, leaves, depth, seed=0):
+    """serialized payload of the given format"""
+    if data_format == 'csv':
+        return make_csv(leaves, seed)
+    document = make_document(leaves, depth, seed)
+    if data_format == 'json':
+        return json.dumps(document)
+    if data_format == 'xml':
+        return to_xml(document)
+    if data_format == 'yaml':
+        return yaml.safe_dump(document)
+    raise ValueError(f"Unknown format {data_format}")
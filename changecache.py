@@ -0,0 +1,86 @@
+"""publish-on-change cache suppressing values that did not change"""
+from collections import OrderedDict
+from logger import log
+
+CHANGE_DETECTION_MODES = ['hash', 'value']
+DEFAULT_CACHE_SIZE = 10000
+
+def _to_number(value):
+    """return value as float, or None if it is not numeric"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class ChangeCache:
+    """remembers the last published value per topic with LRU eviction"""
+    def __init__(self, mode='hash', max_entries=DEFAULT_CACHE_SIZE, heartbeat_cycles=None,
+                 deadband=None, deadband_percent=None):
+        self.mode = mode if mode in CHANGE_DETECTION_MODES else 'hash'
+        self.max_entries = max_entries
+        self.heartbeat_cycles = heartbeat_cycles
+        self.deadband = deadband
+        self.deadband_percent = deadband_percent
+        self.cycle = 0
+        self.heartbeat = False
+        self.published = 0
+        self.suppressed = 0
+        self._entries = OrderedDict()
+
+    def start_cycle(self):
+        """start a new poll cycle, every n-th cycle republishes all values"""
+        self.cycle += 1
+        self.published = 0
+        self.suppressed = 0
+        self.heartbeat = bool(self.heartbeat_cycles) and self.cycle % self.heartbeat_cycles == 0
+        if self.heartbeat:
+            log(f"Heartbeat cycle {self.cycle}, republishing all values", 4)
+
+    def _within_deadband(self, number, last_number):
+        """True if a numeric change stays inside all configured deadbands"""
+        if number is None or last_number is None:
+            return False
+        delta = abs(number - last_number)
+        if self.deadband is not None and delta > self.deadband:
+            return False
+        if self.deadband_percent is not None \
+                and delta > abs(last_number) * self.deadband_percent / 100:
+            return False
+        return True
+
+    def changed(self, topic, value):
+        """True if value has to be published on topic, updates the cache if so"""
+        fingerprint = hash(value) if self.mode == 'hash' else value
+        use_deadband = self.deadband is not None or self.deadband_percent is not None
+        number = _to_number(value) if use_deadband else None
+        entry = self._entries.get(topic)
+        if entry is not None and not self.heartbeat:
+            self._entries.move_to_end(topic)
+            last_fingerprint, last_number = entry
+            if fingerprint == last_fingerprint or \
+                    (use_deadband and self._within_deadband(number, last_number)):
+                self.suppressed += 1
+                return False
+        self._entries[topic] = (fingerprint, number)
+        self._entries.move_to_end(topic)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.published += 1
+        return True
+
+    def forget(self, topics):
+        """drop the cached values of topics, e.g. because they never reached the broker"""
+        for topic in topics:
+            self._entries.pop(topic, None)
+
+def create_change_cache(config):
+    """create the change cache of a configuration set, None if disabled"""
+    if not config.get('publish_on_change'):
+        return None
+    return ChangeCache(config.get('change_detection', 'hash'),
+                       config.get('change_cache_size') or DEFAULT_CACHE_SIZE,
+                       config.get('heartbeat_cycles'),
+                       config.get('deadband'),
+                       config.get('deadband_percent'))
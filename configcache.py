@@ -0,0 +1,44 @@
+"""cache of the validated configuration file, skipping the YAML parsing on every start"""
+import hashlib
+import os
+import pickle
+from logger import log
+
+CACHE_VERSION = 1  # increase when the cached structure changes
+
+def cache_path(config_file):
+    """path of the cache of a configuration file in the cache directory of the user"""
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    name = hashlib.sha1(os.path.abspath(config_file).encode('utf-8')).hexdigest()
+    return os.path.join(base, 'data2mqtt', f"{name}.pickle")
+
+def signature(config_file):
+    """identifies the current content of a configuration file"""
+    stat = os.stat(config_file)
+    return (CACHE_VERSION, os.path.abspath(config_file), stat.st_mtime_ns, stat.st_size)
+
+def load_cached(config_file):
+    """(configurations, settings) from the cache, None if it is missing or outdated"""
+    try:
+        with open(cache_path(config_file), 'rb') as file:
+            cached_signature, result = pickle.load(file)
+        if cached_signature == signature(config_file):
+            log("Using the cached configuration", 4)
+            return result
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log(f"Ignoring the configuration cache: {e}", 3)
+    return None
+
+def store_cached(config_file, file_signature, result):
+    """cache a configuration file that was read with the given signature"""
+    path = cache_path(config_file)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        with open(temp_path, 'wb') as file:
+            pickle.dump((file_signature, result), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except Exception as e:
+        log(f"Could not write the configuration cache: {e}", 3)
@@ -23,8 +23,8 @@ def load_config():
 
     with open(CFGFILE, 'r') as file:
         try:
-            config_data = yaml.safe_load(file)
-            return config_data.get('configurations', [])
+            config_data = yaml.safe_load(file) or {}
+            return config_data.get('configurations') or []
         except yaml.YAMLError as e:
             flash(f"Error loading YAML file: {e}", "danger")
             return []
@@ -38,10 +38,20 @@ def save_config(configurations):
             flash(f"Error: Configuration is missing the 'name' field: {config}", "danger")
             return  # Abbrechen, falls ein Name fehlt
 
+    # keep the other top-level sections of the file, e.g. the global settings
+    config_data = {}
+    if os.path.exists(CFGFILE):
+        with open(CFGFILE, 'r') as file:
+            try:
+                config_data = yaml.safe_load(file) or {}
+            except yaml.YAMLError:
+                config_data = {}
+    config_data['configurations'] = configurations
+
     # Speichere die Konfigurationen in die YAML-Datei
     try:
         with open(CFGFILE, 'w') as file:
-            yaml.dump({'configurations': configurations}, file)
+            yaml.dump(config_data, file)
             flash("Configurations saved successfully!", "success")
     except Exception as e:
         flash(f"Error saving configurations: {e}", "danger")
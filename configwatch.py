@@ -0,0 +1,95 @@
+"""change notification for the configuration file"""
+import os
+import threading
+from logger import log
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+DEFAULT_POLL_INTERVAL = 5
+DEFAULT_DEBOUNCE = 0.5
+
+class _FileEventHandler(FileSystemEventHandler):
+    """forwards the events of a single file to the watcher"""
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        """called by watchdog for every event in the watched directory"""
+        paths = {getattr(event, 'src_path', None), getattr(event, 'dest_path', None)}
+        if self.watcher.path in {os.path.abspath(path) for path in paths if path}:
+            self.watcher.notify()
+
+class ConfigWatcher:
+    """calls callback whenever the configuration file has been changed"""
+    def __init__(self, config_file, callback, poll_interval=DEFAULT_POLL_INTERVAL,
+                 debounce=DEFAULT_DEBOUNCE):
+        self.path = os.path.abspath(config_file)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._observer = None
+        self._timer = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def notify(self):
+        """report a change once the file has been quiet for the debounce time"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            # editors and the config editor write a file in several steps
+            self._timer = threading.Timer(self.debounce, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self):
+        """run the callback"""
+        log(f"{self.path} has been modified.", 1)
+        try:
+            self.callback()
+        except Exception as e:
+            log(f"Error handling the change of {self.path}: {e}", 1)
+
+    def _stat(self):
+        """modification time and size of the file, None if it does not exist"""
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _poll(self):
+        """fallback: compare the file status every poll interval"""
+        last_stat = self._stat()
+        while not self._stopped.wait(self.poll_interval):
+            current_stat = self._stat()
+            if current_stat != last_stat:
+                last_stat = current_stat
+                self.notify()
+
+    def start(self):
+        """start watching the file via inotify (watchdog) or by polling"""
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_FileEventHandler(self), os.path.dirname(self.path))
+            self._observer.daemon = True
+            self._observer.start()
+            log(f"Watching {self.path} for changes", 3)
+        else:
+            log(f"watchdog is not installed, polling {self.path} for changes", 3)
+            threading.Thread(target=self._poll, name="configwatch", daemon=True).start()
+
+    def stop(self):
+        """stop watching the file"""
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
@@ -0,0 +1,79 @@
+"""detection of the data format from the content type header or the data itself"""
+import re
+
+CONTENT_TYPE_FORMATS = {
+    'application/json': 'json',
+    'text/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/x-jsonlines': 'ndjson',
+    'application/xml': 'xml',
+    'text/xml': 'xml',
+    'application/x-yaml': 'yaml',
+    'application/yaml': 'yaml',
+    'text/yaml': 'yaml',
+    'text/x-yaml': 'yaml',
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'text/comma-separated-values': 'csv',
+}
+SUFFIX_FORMATS = {'+json': 'json', '+xml': 'xml', '+yaml': 'yaml'}
+DATA_FORMATS = ['json', 'ndjson', 'xml', 'yaml', 'csv']
+SNIFF_BYTES = 4096
+
+_YAML_LINE = re.compile(r'^(---|- |[\w"\'.-]+:(\s|$))')
+
+def parse_media_type(content_type):
+    """split a content type header into the media type and its parameters"""
+    media_type, *parameters = (content_type or '').split(';')
+    params = {}
+    for parameter in parameters:
+        name, _, value = parameter.partition('=')
+        if name.strip():
+            params[name.strip().lower()] = value.strip().strip('"')
+    return media_type.strip().lower(), params
+
+def format_of(content_type):
+    """map a content type header to a data format, None if it is ambiguous"""
+    media_type, _ = parse_media_type(content_type)
+    data_format = CONTENT_TYPE_FORMATS.get(media_type)
+    if data_format is None:
+        for suffix, suffix_format in SUFFIX_FORMATS.items():
+            if media_type.endswith(suffix):
+                return suffix_format
+    return data_format
+
+def sniff_format(data):
+    """guess the data format from the first bytes of the data"""
+    if isinstance(data, bytes):
+        data = data[:SNIFF_BYTES].decode('utf-8', errors='ignore')
+    head = data[:SNIFF_BYTES].lstrip('﻿ \t\r\n')
+    if not head:
+        return None
+    if head[0] in '{[':
+        return 'json'
+    if head[0] == '<':
+        return 'xml'
+    lines = head.splitlines()
+    if _YAML_LINE.match(lines[0]):
+        return 'yaml'
+    # CSV: a header and rows with the same number of separators
+    complete_lines = lines[:-1] if len(lines) > 1 else lines
+    separators = {line.count(',') for line in complete_lines if line}
+    if len(separators) == 1 and separators.pop() > 0:
+        return 'csv'
+    return None
+
+def detect_format(content_type, data=None, override=None, cached=None):
+    """return (data format, True if it had to be sniffed from the data)"""
+    if override in DATA_FORMATS:
+        return override, False
+    data_format = format_of(content_type)
+    if data_format is not None:
+        return data_format, False
+    if cached is not None:
+        return cached, False
+    if data is None:
+        return None, False
+    return sniff_format(data), True
@@ -0,0 +1,99 @@
+"""column-wise processing of CSV data with row-aware topics"""
+import csv
+from itertools import islice
+from logger import log
+
+DEFAULT_TOPIC = "{column}"
+DEFAULT_CHUNK_SIZE = 1000
+
+def _to_bool(value):
+    """interpret a CSV cell as boolean"""
+    text = value.strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"not a boolean: {value}")
+
+CONVERTERS = {'int': int, 'float': float, 'bool': _to_bool, 'str': None}
+
+def _convert_column(values, converter):
+    """convert all cells of a column, keeping the cells that cannot be converted"""
+    try:
+        return list(map(converter, values))
+    except (TypeError, ValueError):
+        converted = []
+        for value in values:
+            try:
+                converted.append(converter(value))
+            except (TypeError, ValueError):
+                converted.append(value)
+        return converted
+
+class CsvLayout:
+    """selects, converts and names the cells of a CSV table chunk by chunk"""
+    def __init__(self, topic=DEFAULT_TOPIC, key_column=None, columns=None,
+                 exclude_columns=None, column_types=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.topic = topic or DEFAULT_TOPIC
+        self.key_column = key_column
+        self.columns = columns
+        self.exclude_columns = set(exclude_columns or [])
+        self.converters = {column: CONVERTERS.get(type_name)
+                           for column, type_name in (column_types or {}).items()}
+        self.chunk_size = max(1, chunk_size)
+        # the legacy layout publishes every row on the plain column topics
+        self.per_column_topics = self.topic == DEFAULT_TOPIC
+
+    def _selected(self, header):
+        """indexes of the columns that are published"""
+        return [index for index, column in enumerate(header)
+                if (self.columns is None or column in self.columns)
+                and column not in self.exclude_columns]
+
+    def cells(self, lines, first_row=0):
+        """yield (key, value) for every selected cell of the CSV lines"""
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        width = len(header)
+        selected = self._selected(header)
+        key_index = None
+        if '{key}' in self.topic:
+            if self.key_column in header:
+                key_index = header.index(self.key_column)
+            else:
+                log(f"Key column '{self.key_column}' not found, using the row index", 1)
+        row_offset = first_row
+        while True:
+            chunk = list(islice(reader, self.chunk_size))
+            if not chunk:
+                break
+            # pad short rows so the chunk can be transposed into columns
+            chunk = [row if len(row) >= width else row + [''] * (width - len(row))
+                     for row in chunk]
+            columns = list(zip(*chunk))
+            keys = columns[key_index] if key_index is not None else None
+            for index in selected:
+                column = header[index]
+                values = columns[index]
+                converter = self.converters.get(column)
+                if converter is not None:
+                    values = _convert_column(values, converter)
+                if self.per_column_topics:
+                    for value in values:
+                        yield column, value
+                    continue
+                for row, value in enumerate(values, row_offset):
+                    key = keys[row - row_offset] if keys is not None else row
+                    yield self.topic.format(column=column, row=row, key=key), value
+            row_offset += len(chunk)
+
+def create_csv_layout(config):
+    """create the CSV layout of a configuration set"""
+    return CsvLayout(config.get('csv_topic', DEFAULT_TOPIC),
+                     config.get('key_column'),
+                     config.get('columns'),
+                     config.get('exclude_columns'),
+                     config.get('column_types'),
+                     config.get('csv_chunk_size') or DEFAULT_CHUNK_SIZE)
@@ -1,81 +1,338 @@
 """importing dependencies"""
 import os
+import re
 import sys
-import json
-import csv
+import signal
+import threading
 import time
 import argparse
 from io import StringIO
 from urllib.parse import urlparse
-import yaml
-import requests
-import xmltodict
-import paho.mqtt.client as mqtt
-from logger import log
-
-def publish_to_mqtt(client, topic, value, prefix=""):
+from logger import is_enabled, log
+from mqttpool import BrokerPool
+from fetchengine import ENGINES, create_engine, host_of
+from scheduler import Job, Scheduler
+from changecache import create_change_cache
+from flatten import Flattener, create_flattener
+from publisher import create_properties, create_publisher
+from payloads import CONTENT_TYPES, create_aggregator, create_value_encoder
+import metrics
+from supervisor import ShardFilter, Supervisor, parse_shard
+from parsers import parsers
+from contenttype import detect_format
+from csvtable import CsvLayout, create_csv_layout
+from topicrules import compile_rules
+from tail import TAIL_FORMATS, create_tail
+from spool import create_spool
+from pagination import create_paginator, prefetch
+from health import RunOutcome, create_health
+from sharedfetch import SharedResponse, shared_fetches
+from configcache import load_cached, signature, store_cached
+
+DEFAULT_TIMEOUT = 30
+
+# Parsers, the HTTP client and the streaming parsers are imported on first use,
+# so runs that do not need them start faster.
+
+class SourceState:
+    """state of a configuration set that is kept between its runs"""
+    def __init__(self, config):
+        self.name = config.get('name', "commandline")
+        self.leaves = 0  # data points found in the current run
+        self.change_cache = create_change_cache(config)
+        # conditional requests only make sense if unchanged data need not be republished
+        self.conditional_requests = config.get('conditional_requests',
+                                               bool(config.get('publish_on_change')))
+        self.validators = {}  # url -> (ETag, Last-Modified) of the last response to this set
+        self.streaming = bool(config.get('streaming'))
+        self.tail = create_tail(config)
+        self.spool = create_spool(config)
+        self.paginator = create_paginator(config)
+        # configuration sets with the same URL share fetches within this time
+        self.shared_fetch_ttl = config.get('shared_fetch_ttl')
+        self.shared_response = None   # response of the current run if it is shared
+        self.errors = 0               # errors of the current run
+        self.content_changed = None   # whether the fetched data differs from the last run
+        self.data_digest = None
+        self.separator = config.get('topic_separator') or '.'
+        # rules are compiled when the configuration file is loaded
+        self.rules = config['_rules'] if '_rules' in config else compile_rules(config)
+        self.flattener = create_flattener(config, self.rules)
+        self.aggregator = create_aggregator(config)
+        # payload encoding and MQTT v5 properties are built once, not per value
+        self.encode = create_value_encoder(config)
+        self.mqtt_properties = create_properties(
+            config, CONTENT_TYPES.get(config.get('payload_encoding', 'string')))
+        self.csv_layout = create_csv_layout(config)
+        self.parser_backends = config.get('parser_backends') or {}
+        self.format_override = config.get('format')
+        self.detected_format = None  # format found by sniffing, reused by later runs
+
+    def start_run(self):
+        """reset the bookkeeping of a run"""
+        self.leaves = 0
+        self.errors = 0
+        self.content_changed = None
+
+    def data_changed(self):
+        """True if the current run found data that differs from the last run"""
+        if self.change_cache is not None:
+            return self.change_cache.published > 0
+        if self.content_changed is not None:
+            return self.content_changed
+        return self.leaves > 0
+
+    def use_conditional_request(self):
+        """True if the next request may be answered with 304 Not Modified"""
+        if self.change_cache is not None and self.change_cache.heartbeat:
+            return False
+        return self.conditional_requests
+
+def parse_data(data_format, data, state=None):
+    """parse data with the parser backend of the configuration set, or the fastest one"""
+    backend = state.parser_backends.get(data_format) if state is not None else None
+    shared = state.shared_response if state is not None else None
+    if shared is not None and data is shared.text:
+        return shared.parse(data_format, backend, parsers.get(data_format, backend))
+    return parsers.parse(data_format, data, backend)
+
+def metrics_label(state):
+    """config label of the metrics of a configuration set"""
+    return state.name if state is not None else ""
+
+def count_error(state, stage):
+    """count an error of a processing stage in the metrics"""
+    metrics.errors.inc(config=metrics_label(state), stage=stage)
+    if state is not None:
+        state.errors += 1
+
+def parse_failed(state):
+    """count a parse error and forget a sniffed format so the next run sniffs again"""
+    count_error(state, 'parse')
+    if state is not None:
+        state.detected_format = None
+
+def apply_rules(state, pairs):
+    """apply the rules of the configuration set to (key, value) pairs not flattened by it"""
+    if state is None or state.rules is None:
+        return pairs
+    return state.rules.apply(pairs)
+
+def publish_to_mqtt(client, topic, value, prefix="", state=None):
     """publishing parsed data to MQTT server"""
-    full_topic = f"{prefix}.{topic}" if prefix else topic
-    log(f"Publishing to MQTT: Topic: {full_topic}, Value: {value}", 4)
+    separator = state.separator if state is not None else '.'
+    full_topic = f"{prefix}{separator}{topic}" if prefix and topic else topic or prefix
+    if state is not None:
+        state.leaves += 1
+        if state.change_cache is not None and not state.change_cache.changed(full_topic, value):
+            return
+    if is_enabled(4):
+        log("Publishing to MQTT: Topic: %s, Value: %s", 4, full_topic, value)
     client.publish(full_topic, value)
 
-def process_json(client, json_obj, parent_key="", prefix=""):
+def process_json(client, json_obj, parent_key="", prefix="", state=None):
     """processing JSON data"""
-    if isinstance(json_obj, dict):
-        for key, value in json_obj.items():
-            full_key = f"{parent_key}.{key}" if parent_key else key
-            if isinstance(value, dict):
-                process_json(client, value, full_key, prefix)
-            else:
-                publish_to_mqtt(client, full_key, str(value), prefix)
+    flattener = state.flattener if state is not None else Flattener(use_plan=False)
+    encode = state.encode if state is not None else str
+    aggregator = state.aggregator if state is not None else None
+    if flattener.accepts(json_obj):
+        if aggregator is not None and aggregator.enabled:
+            for topic, payload in aggregator.messages(json_obj):
+                publish_to_mqtt(client, topic, payload, prefix, state)
+            if not aggregator.publish_leaves:
+                return
+        for key, value in flattener.flatten(json_obj, parent_key):
+            publish_to_mqtt(client, key, encode(value), prefix, state)
     else:
         log("The JSON object is not structured as expected.", 1)
 
-def process_xml(client, xml_data, prefix=""):
+def process_xml(client, xml_data, prefix="", state=None):
     """processing XML data"""
     try:
-        json_data = xmltodict.parse(xml_data)
-        process_json(client, json_data, prefix=prefix)
+        json_data = parse_data('xml', xml_data, state)
+        process_json(client, json_data, prefix=prefix, state=state)
     except Exception as e:
         log(f"Error processing XML data: {e}", 1)
+        parse_failed(state)
 
-def process_yaml(client, yaml_data, prefix=""):
+def process_yaml(client, yaml_data, prefix="", state=None):
     """processing YAML data"""
     try:
-        json_data = yaml.safe_load(yaml_data)
-        process_json(client, json_data, prefix=prefix)
-    except yaml.YAMLError as e:
+        json_data = parse_data('yaml', yaml_data, state)
+        process_json(client, json_data, prefix=prefix, state=state)
+    except Exception as e:
         log(f"Error processing YAML data: {e}", 1)
+        parse_failed(state)
 
-def process_csv(client, csv_data, prefix=""):
-    """processing CSV data"""
+def process_csv(client, csv_data, prefix="", state=None, first_row=0):
+    """processing CSV data, first_row is the {row} index of the first data row"""
+    layout = state.csv_layout if state is not None else CsvLayout()
+    encode = state.encode if state is not None else str
     try:
-        csv_reader = csv.DictReader(StringIO(csv_data))
-        for row in csv_reader:
-            for key, value in row.items():
-                publish_to_mqtt(client, key, value, prefix)
+        cells = layout.cells(StringIO(csv_data, newline=''), first_row)
+        for key, value in apply_rules(state, cells):
+            publish_to_mqtt(client, key, encode(value), prefix, state)
     except Exception as e:
         log(f"Error processing CSV data: {e}", 1)
+        parse_failed(state)
 
-def detect_and_process_data(client, data, content_type, prefix=""):
+def process_json_lines(client, text, prefix="", state=None):
+    """processing JSON lines, every line is a document of its own"""
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            json_data = parse_data('json', line, state)
+        except ValueError as e:
+            log(f"Error processing JSON line: {e}", 1)
+            parse_failed(state)
+            continue
+        process_json(client, json_data, prefix=prefix, state=state)
+
+def detect_and_process_data(client, data, content_type, prefix="", state=None):
     """check if data is correctly formatted before publishing it"""
     log(f"trying to parse data: {content_type}",15)
-    if content_type == 'application/json' or content_type == 'text/json':
+    if state is not None:
+        digest = hash(data)
+        state.content_changed = digest != state.data_digest
+        state.data_digest = digest
+    data_format = format_of(content_type, state, data)
+    if data_format == 'json':
         try:
-            json_data = json.loads(data)
-            process_json(client, json_data, prefix=prefix)
-        except json.JSONDecodeError as e:
+            json_data = parse_data('json', data, state)
+            process_json(client, json_data, prefix=prefix, state=state)
+        except ValueError as e:
             log(f"Error processing JSON data: {e}", 1)
-    elif content_type == 'application/xml' or content_type == 'text/xml':
-        process_xml(client, data, prefix=prefix)
-    elif content_type == 'application/x-yaml' or content_type == 'text/yaml':
-        process_yaml(client, data, prefix=prefix)
-    elif content_type == 'text/csv' or content_type == 'application/csv':
-        process_csv(client, data, prefix=prefix)
+            parse_failed(state)
+    elif data_format == 'ndjson':
+        process_json_lines(client, data, prefix=prefix, state=state)
+    elif data_format == 'xml':
+        process_xml(client, data, prefix=prefix, state=state)
+    elif data_format == 'yaml':
+        process_yaml(client, data, prefix=prefix, state=state)
+    elif data_format == 'csv':
+        process_csv(client, data, prefix=prefix, state=state)
     else:
         log("Unable to determine or process data format.", 1)
-
-def fetch_and_publish_data(client, url, auth, verify, prefix):
+        count_error(state, 'format')
+
+def stream_and_process_data(client, fileobj, content_type, prefix="", state=None,
+                            encoding=None):
+    """parse a binary file object incrementally and publish every data point on the fly"""
+    from streaming import stream_data
+    data_format = format_of(content_type, state)
+    log(f"streaming {data_format} data", 15)
+    try:
+        csv_layout = state.csv_layout if state is not None else None
+        separator = state.separator if state is not None else '.'
+        encode = state.encode if state is not None else str
+        pairs = stream_data(fileobj, data_format, encoding, csv_layout, separator)
+        for key, value in apply_rules(state, pairs):
+            publish_to_mqtt(client, key, encode(value), prefix, state)
+    except Exception as e:
+        log(f"Error processing streamed {data_format} data: {e}", 1)
+        parse_failed(state)
+
+def tail_and_process_data(client, file_path, content_type, prefix="", state=None):
+    """publish only the records appended to a local file since the last run"""
+    with metrics.fetch_seconds.time(config=metrics_label(state)):
+        chunks = state.tail.read(file_path)
+    for header, data, first_row in chunks:
+        data_format = format_of(content_type, state, data)
+        if data_format not in TAIL_FORMATS:
+            log(f"Tail mode supports JSON lines and CSV, not {data_format} data", 1)
+            count_error(state, 'format')
+            continue
+        with metrics.parse_seconds.time(config=metrics_label(state)):
+            if data_format == 'csv':
+                # appended rows are parsed with the header of the file
+                text = (header + data).decode('utf-8', errors='replace')
+                process_csv(client, text, prefix, state, first_row)
+            else:
+                text = data.decode('utf-8', errors='replace')
+                process_json_lines(client, text, prefix, state)
+
+def process_page(client, response, prefix="", state=None):
+    """publish a page of a paginated source, returns its JSON document if it was inspected"""
+    content_type = response.headers.get('Content-Type', '')
+    data = response.text
+    if not state.paginator.needs_document or format_of(content_type, state, data) != 'json':
+        detect_and_process_data(client, data, content_type, prefix, state)
+        return None
+    try:
+        document = parse_data('json', data, state)
+    except ValueError as e:
+        log(f"Error processing JSON data: {e}", 1)
+        parse_failed(state)
+        return None
+    process_json(client, state.paginator.new_records(document), prefix=prefix, state=state)
+    return document
+
+def fetch_pages_and_process(client, url, auth, verify, prefix, timeout, state):
+    """fetch the pages of a paginated source and publish them in order"""
+    from httpclient import sessions
+    paginator = state.paginator
+
+    def fetch(page_url):
+        with metrics.fetch_seconds.time(config=metrics_label(state)):
+            return sessions.get(page_url, auth=auth, verify=verify, timeout=timeout)
+
+    pages = 0
+    if paginator.kind in ('page', 'offset'):
+        # the next pages are already requested while the current one is published
+        responses = prefetch(fetch, paginator.page_urls(url), paginator.concurrency)
+        try:
+            for response in responses:
+                pages += 1
+                with metrics.parse_seconds.time(config=metrics_label(state)):
+                    document = process_page(client, response, prefix, state)
+                if paginator.is_last(document):
+                    break
+        finally:
+            responses.close()
+    else:
+        page_url = paginator.first_url(url)
+        while page_url and pages < paginator.max_pages:
+            response = fetch(page_url)
+            pages += 1
+            with metrics.parse_seconds.time(config=metrics_label(state)):
+                document = process_page(client, response, prefix, state)
+            page_url = paginator.next_url(url, response, document)
+    log(f"Fetched {pages} page(s) from {url}", 3)
+
+def fetch_shared(url, auth, verify, timeout, state):
+    """fetch url once for all configuration sets that request it within the TTL"""
+    from httpclient import sessions
+
+    def load():
+        response = sessions.get(url, auth=auth, verify=verify, timeout=timeout)
+        with response:
+            return SharedResponse(response.headers.get('Content-Type', ''), response.text)
+
+    with metrics.fetch_seconds.time(config=metrics_label(state)):
+        return shared_fetches.get((url, auth, str(verify)), state.shared_fetch_ttl, load)
+
+def format_of(content_type, state=None, data=None):
+    """determine the data format from the config, the content type, the cache or the data"""
+    if state is None:
+        data_format, sniffed = detect_format(content_type, data)
+    else:
+        data_format, sniffed = detect_format(content_type, data, state.format_override,
+                                             state.detected_format)
+        if sniffed and data_format is not None:
+            log(f"Content type '{content_type}' is ambiguous, detected {data_format} data", 3)
+            state.detected_format = data_format
+    return data_format
+
+def use_streaming(state, content_type):
+    """True if the data should be parsed incrementally"""
+    if state is None or not state.streaming:
+        return False
+    from streaming import can_stream
+    return can_stream(format_of(content_type, state))
+
+def fetch_and_publish_data(client, url, auth, verify, prefix, timeout=DEFAULT_TIMEOUT,
+                           state=None):
     """request data from URL or local file"""
     log("Fetching data ...", 15)
     parsed_url = urlparse(url)
@@ -85,34 +342,81 @@ def fetch_and_publish_data(client, url, auth, verify, prefix):
         file_path = parsed_url.path
         if not os.path.exists(file_path):
             log(f"Error: Local file {file_path} not found.", 1)
+            count_error(state, 'fetch')
             return
 
         try:
-            with open(file_path, 'r') as file:
+            content_type = guess_content_type(file_path)
+            log(f"Content type detected as: {content_type}",15)
+            if state is not None and state.tail is not None:
+                tail_and_process_data(client, file_path, content_type, prefix, state)
+                return
+            if use_streaming(state, content_type):
+                with open(file_path, 'rb') as file, \
+                        metrics.parse_seconds.time(config=metrics_label(state)):
+                    stream_and_process_data(client, file, content_type, prefix, state)
+                return
+            with open(file_path, 'r') as file, \
+                    metrics.fetch_seconds.time(config=metrics_label(state)):
                 data = file.read()
-                content_type = guess_content_type(file_path)
-                log(f"Content type detected as: {content_type}",15)
-                detect_and_process_data(client, data, content_type, prefix)
+            with metrics.parse_seconds.time(config=metrics_label(state)):
+                detect_and_process_data(client, data, content_type, prefix, state)
         except Exception as e:
             log(f"Error reading local file {file_path}: {e}", 1)
+            count_error(state, 'fetch')
     else:
         # Handle HTTP/HTTPS
         log(f"this is a remote data source ({url})",15)
+        import requests
+        from httpclient import sessions
         try:
-            response = requests.get(url, auth=auth, verify=verify)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            content_type = response.headers.get('Content-Type', '').lower()
-            data = response.text
-            log(f"data received: \n {data}",25)
-            detect_and_process_data(client, data, content_type, prefix)
+            if state is not None and state.paginator is not None:
+                fetch_pages_and_process(client, url, auth, verify, prefix, timeout, state)
+                return
+            if state is not None and state.shared_fetch_ttl is not None and not state.streaming:
+                state.shared_response = fetch_shared(url, auth, verify, timeout, state)
+                try:
+                    with metrics.parse_seconds.time(config=metrics_label(state)):
+                        detect_and_process_data(client, state.shared_response.text,
+                                                state.shared_response.content_type, prefix,
+                                                state)
+                finally:
+                    state.shared_response = None
+                return
+            conditional = state is not None and state.use_conditional_request()
+            streaming = state is not None and state.streaming
+            fetch_start = time.perf_counter()
+            response = sessions.get(url, auth=auth, verify=verify, timeout=timeout,
+                                    conditional=conditional, stream=streaming,
+                                    validators=state.validators if state is not None else None)
+            if response is None:
+                # 304 Not Modified, nothing to parse or publish
+                return
+            with response:
+                content_type = response.headers.get('Content-Type', '')
+                if use_streaming(state, content_type):
+                    response.raw.decode_content = True
+                    with metrics.parse_seconds.time(config=metrics_label(state)):
+                        stream_and_process_data(client, response.raw, content_type, prefix,
+                                                state, response.encoding)
+                    return
+                data = response.text
+                metrics.fetch_seconds.observe(time.perf_counter() - fetch_start,
+                                              config=metrics_label(state))
+                log("data received: \n %s", 25, data)
+                with metrics.parse_seconds.time(config=metrics_label(state)):
+                    detect_and_process_data(client, data, content_type, prefix, state)
         except requests.exceptions.RequestException as e:
             log(f"Error fetching data from the URL: {e}", 1)
+            count_error(state, 'fetch')
 
 def guess_content_type(file_path):
     """Guess the content type based on file extension."""
     _, ext = os.path.splitext(file_path)
     if ext in ['.json','.jsn']:
         return 'application/json'
+    if ext in ['.jsonl', '.ndjson']:
+        return 'application/x-ndjson'
     if ext in ['.xml']:
         return 'application/xml'
     if ext in ['.yaml', '.yml']:
@@ -121,18 +425,40 @@ def guess_content_type(file_path):
         return 'text/csv'
     return 'text/plain'
 
-def load_config_file(config_file):
-    """load configuration file"""
+def load_config_file(config_file, exit_on_error=True, use_cache=True):
+    """load configuration file, returns the configuration sets and global settings"""
     try:
+        file_signature = signature(config_file)
+        if use_cache:
+            cached = load_cached(config_file)
+            if cached is not None:
+                return cached
+        import yaml
         with open(config_file, 'r') as file:
-            config_data = yaml.safe_load(file)
-            return config_data.get('configurations', [])
+            try:
+                config_data = yaml.safe_load(file) or {}
+            except yaml.YAMLError as e:
+                raise ValueError(f"Failed to parse YAML configuration file: {e}") from e
+        configurations = config_data.get('configurations') or []
+        for config in configurations:
+            if not isinstance(config, dict):
+                continue
+            try:
+                config['_rules'] = compile_rules(config)
+            except (ValueError, re.error) as e:
+                raise ValueError(f"Invalid rules in configuration set " \
+                                 f"'{config.get('name')}': {e}") from e
+        result = configurations, config_data.get('settings') or {}
+        if use_cache:
+            store_cached(config_file, file_signature, result)
+        return result
     except FileNotFoundError:
         log(f"Error: Configuration file {config_file} not found.", 1)
+    except ValueError as e:
+        log(f"Error: {e}", 1)
+    if exit_on_error:
         sys.exit(1)
-    except yaml.YAMLError as e:
-        log(f"Error: Failed to parse YAML configuration file: {e}", 1)
-        sys.exit(1)
+    return None
 
 def get_config_by_name(configurations, name):
     """access a specific configuration set within the configuration file"""
@@ -142,6 +468,17 @@ def get_config_by_name(configurations, name):
     log(f"Error: Configuration with name '{name}' not found in the configuration file.", 1)
     sys.exit(1)
 
+def select_configs(configurations, selection):
+    """return the configuration sets chosen by --config, skipping unknown names"""
+    if selection.lower() == "all":
+        return configurations
+    config_names = [name.strip() for name in selection.split(",")]
+    selected = [config for config in configurations if config.get('name') in config_names]
+    missing = set(config_names) - {config.get('name') for config in selected}
+    for name in missing:
+        log(f"Error: Configuration with name '{name}' not found in the configuration file.", 1)
+    return selected
+
 def merge_configs(base_config, override_config):
     """merge configurations if changes need to be incorporated"""
     return {**base_config, **{k: v for k, v in override_config.items() if v is not None}}
@@ -158,7 +495,7 @@ def parse_mqtt_host_and_port(mqtt_host, mqtt_port):
     else:
         return mqtt_host, mqtt_port  # Default MQTT port
 
-def process_config(client, config, config_name):
+def process_config(pool, config, config_name, state=None):
     """process the configuration sets one by one"""
     # Log the configuration name at Loglevel 2 or higher
     log(f"Processing config: {config_name}", 2)
@@ -167,18 +504,22 @@ def process_config(client, config, config_name):
     log(f"Fetching data from URL: {config['url']}", 3)
 
     # Log all defined parameters at Loglevel 10
-    log(f"Defined parameters: {config}", 10)
+    log("Defined parameters: %s", 10, config)
+    if state is not None:
+        state.start_run()
 
     # Certificate verification configuration
-    verify = config.get('verify', 'true')
+    verify = str(config.get('verify', 'true'))
     if verify.lower() == "false":
         log("verify disabled",15)
         verify = False
+    elif verify.lower() == "true":
+        verify = True
     elif os.path.isfile(verify):
         log(f"verify using custom CA file: {verify}",15)
-    elif verify.lower() != "true":
+    else:
         log(f"Error: The path provided for --verify does not exist or is not a file: {verify}", 1)
-        return
+        return RunOutcome(False, False, 0)
 
     # Set up URL authentication if credentials are provided
     auth = None
@@ -191,19 +532,293 @@ def process_config(client, config, config_name):
     mqtt_host, mqtt_hostport = parse_mqtt_host_and_port(mqtt_server, mqtt_port)
     log(f"Host {mqtt_server}:{mqtt_port}",4)
 
-    # Connect to the MQTT server
+    # Get the pooled connection to the MQTT server
+    mqtt_version = config.get('mqtt_version', 'v3.1.1')  # Default to v3.1.1
+    log(f"Using MQTT version '{mqtt_version}'", 15)
     try:
-        client.connect(mqtt_host, mqtt_hostport, 60)
+        client = pool.get_client(mqtt_host, mqtt_hostport or 1883, mqtt_version,
+                                 config.get('mqttuser', ''), config.get('mqttpassword', ''),
+                                 owner=config_name)
     except Exception as e:
         log(f"Error connecting to the MQTT server: {e}", 1)
-        return
+        # the source is not at fault if the broker is down, so it is not counted in the state
+        metrics.errors.inc(config=config_name, stage='connect')
+        if state is None or state.spool is None:
+            return RunOutcome(None, False, 0)
+        # keep the data on disk until the broker is back
+        client = None
+
+    # Send what was spooled during an outage before the new data
+    if client is not None and state is not None and state.spool is not None:
+        replay_spool(client, config, config_name, state)
 
     # Fetch and publish data
+    change_cache = state.change_cache if state is not None else None
+    if change_cache is not None:
+        change_cache.start_cycle()
+    properties = state.mqtt_properties if state is not None else None
+    spool = state.spool if state is not None else None
+    # failed messages are needed to spool them or to take them out of the change cache
+    keep_undelivered = spool is not None or change_cache is not None
+    publisher = create_publisher(client, config, properties, keep_undelivered) \
+        if client is not None else spool
     try:
-        fetch_and_publish_data(client, config['url'], auth, verify, config.get('prefix', ''))
+        fetch_and_publish_data(publisher, config['url'], auth, verify, config.get('prefix', ''),
+                               config.get('timeout') or DEFAULT_TIMEOUT, state)
     except Exception as e:
         log(f"Error during data fetch and publish: {e}", 1)
-
+        count_error(state, 'run')
+    if client is None:
+        spool_messages([], config_name, spool)
+        commit_positions(state, True)
+        return run_outcome(state, delivered=False)
+    with metrics.publish_seconds.time(config=config_name):
+        delivered, failed = publisher.flush()
+    metrics.messages.inc(delivered, config=config_name, result='delivered')
+    metrics.messages.inc(failed, config=config_name, result='failed')
+    if state is not None:
+        metrics.leaves_per_run.observe(state.leaves, config=config_name)
+    log(f"Config {config_name}: {delivered} messages delivered, {failed} failed", 2,
+        config=config_name, delivered=delivered, failed=failed)
+    if publisher.undelivered and spool is not None:
+        # the broker went away during the run, keep the messages for the replay
+        spool_messages(publisher.undelivered, config_name, spool)
+    elif publisher.undelivered and change_cache is not None:
+        # values the broker did not get are published again by the next run
+        change_cache.forget(topic for topic, _ in publisher.undelivered)
+    # spooled messages are delivered later, others would be skipped by the next run
+    commit_positions(state, failed == 0 or spool is not None)
+    if change_cache is not None:
+        log(f"Config {config_name}: {change_cache.published} values published, " \
+            f"{change_cache.suppressed} unchanged values suppressed", 3, config=config_name,
+            published=change_cache.published, suppressed=change_cache.suppressed)
+    return run_outcome(state, delivered=failed == 0)
+
+
+def run_outcome(state, delivered=True):
+    """outcome of a run for the health tracking of the configuration set"""
+    # messages the broker did not take are not the fault of the source
+    ok = True if delivered else None
+    if state is None:
+        return RunOutcome(ok, True, 0)
+    return RunOutcome(False if state.errors else ok, state.data_changed(), 0)
+
+def commit_positions(state, delivered):
+    """save the cursor and the tail position only if the records of the run reached the broker"""
+    if state is None:
+        return
+    if state.paginator is not None:
+        if delivered:
+            state.paginator.commit()
+        else:
+            state.paginator.rollback()
+    if state.tail is not None and delivered:
+        state.tail.save()
+
+def spool_messages(messages, config_name, spool):
+    """write the messages of a run that did not reach the broker to the spool"""
+    for topic, payload in messages:
+        spool.publish(topic, payload)
+    spooled = spool.flush()
+    metrics.messages.inc(spooled, config=config_name, result='spooled')
+    log(f"Config {config_name}: {spooled} messages spooled", 2,
+        config=config_name, spooled=spooled)
+
+def replay_spool(client, config, config_name, state):
+    """publish the spooled messages and remove them once they are delivered"""
+    spool = state.spool
+    publisher = create_publisher(client, config, state.mqtt_properties)
+    replayed = spool.replay(publisher)
+    if not replayed:
+        return
+    delivered, failed = publisher.flush()
+    metrics.messages.inc(delivered, config=config_name, result='delivered')
+    metrics.messages.inc(failed, config=config_name, result='failed')
+    if failed:
+        log(f"Config {config_name}: {failed} spooled messages failed, keeping the spool", 1)
+    else:
+        spool.clear()
+        log(f"Config {config_name}: {delivered} spooled messages delivered", 2)
+
+def timed_process_config(pool, config, config_name, state=None):
+    """process a configuration set and record the duration of the run"""
+    start = time.perf_counter()
+    with metrics.run_seconds.time(config=config_name):
+        outcome = process_config(pool, config, config_name, state)
+    return outcome._replace(seconds=time.perf_counter() - start)
+
+def create_job(config):
+    """create the scheduler job of a configuration set"""
+    return Job(config['name'], config.get('interval'), config.get('splay'),
+               config.get('jitter'), config.get('overrun', 'skip'))
+
+class Runner:
+    """schedules the configuration sets and hands them to the execution engine"""
+    def __init__(self, args, settings):
+        self.args = args
+        # One long-lived connection per broker, shared by all configuration sets
+        self.pool = BrokerPool()
+
+        # Commandline arguments take precedence over the settings in the configfile
+        self.settings = settings
+        # batch runs process all configuration sets at the same time by default
+        engine_name = args.engine or settings.get('engine') \
+            or ('threads' if args.once else 'sequential')
+        log(f"Using execution engine '{engine_name}'", 3)
+        self.engine = create_engine(engine_name,
+                                    args.max_workers or settings.get('max_workers'),
+                                    args.per_host_limit or settings.get('per_host_limit'))
+
+        # Every configuration set is scheduled on its own grid of time slots
+        self.scheduler = Scheduler()
+        self.final_configs = {}
+        self.states = {}
+        self.health = {}
+        self._reload_requested = threading.Event()
+
+        # In multi-process mode, each worker only runs the configuration sets of its shard
+        self.shard_filter = ShardFilter(args.shard) if args.shard else None
+
+    def owns(self, config):
+        """True if the configuration set belongs to the shard of this process"""
+        return self.shard_filter is None or self.shard_filter(config)
+
+    def add_config(self, config, schedule=True):
+        """schedule a configuration set, or only prepare it for run_once"""
+        # check if a "name" key is found in the configuration
+        if 'name' not in config:
+            log(f"Error: Missing 'name' key in one of the configuration sets: {config}", 1)
+            return  # skipping this configuration set
+
+        final_config = merge_configs(config, vars(self.args))
+        self.final_configs[config['name']] = final_config
+        self.states[config['name']] = SourceState(final_config)
+        self.health[config['name']] = create_health(final_config)
+        if schedule:
+            self.scheduler.add(create_job(final_config))
+
+    def remove_config(self, name):
+        """unschedule a configuration set and drop its state"""
+        self.scheduler.remove(name)
+        self.final_configs.pop(name, None)
+        self.health.pop(name, None)
+        state = self.states.pop(name, None)
+        if state is not None and state.tail is not None:
+            state.tail.close()
+
+    def job_finished(self, job, future):
+        """record the outcome of a run and start a coalesced run if one is waiting"""
+        health = self.health.get(job.name)
+        if health is not None and not job.removed:
+            if future.exception() is None:
+                outcome = future.result()
+            else:
+                outcome = RunOutcome(False, False, 0)
+            interval = health.record(outcome)
+            if interval != job.interval:
+                log(f"Config {job.name}: polling every {interval:.1f} seconds", 3)
+                self.scheduler.set_interval(job, interval)
+        job.running = False
+        if job.pending:
+            job.pending = False
+            self.scheduler.run_now(job)
+
+    def dispatch(self, job):
+        """hand a due job over to the execution engine"""
+        final_config = self.final_configs[job.name]
+        health = self.health.get(job.name)
+        if health is not None and not health.allow():
+            log(f"Config {job.name}: circuit open, skipping this run", 4)
+            return
+        job.running = True
+        metrics.schedule_lag_seconds.observe(max(0, time.time() - job.due), config=job.name)
+        future = self.engine.submit(host_of(final_config.get('url')), timed_process_config,
+                                    self.pool, final_config, job.name, self.states[job.name])
+        future.add_done_callback(lambda done: self.job_finished(job, done))
+
+    def request_reload(self):
+        """ask the main loop to reload the configuration file"""
+        self._reload_requested.set()
+        self.scheduler.wake()
+
+    def reload(self):
+        """apply the changes of the configuration file to the running jobs"""
+        result = load_config_file(self.args.configfile, exit_on_error=False,
+                                  use_cache=not self.args.no_config_cache)
+        if result is None:
+            log("Keeping the current configuration.", 1)
+            return
+        configurations, settings = result
+        if settings != self.settings:
+            log("Changed settings only take effect after a restart.", 1)
+
+        new_configs = {}
+        for config in select_configs(configurations, self.args.config):
+            if 'name' not in config:
+                log(f"Error: Missing 'name' key in one of the configuration sets: {config}", 1)
+                continue
+            if self.owns(config):
+                new_configs[config['name']] = config
+
+        added, removed, changed = [], [], []
+        for name in list(self.final_configs):
+            if name not in new_configs:
+                self.remove_config(name)
+                self.pool.release(name)
+                removed.append(name)
+        for name, config in new_configs.items():
+            if name not in self.final_configs:
+                self.add_config(config)
+                added.append(name)
+            elif merge_configs(config, vars(self.args)) != self.final_configs[name]:
+                # changed jobs start over with a fresh state
+                self.remove_config(name)
+                self.add_config(config)
+                changed.append(name)
+        log(f"Configuration reloaded: added {added}, removed {removed}, changed {changed}, " \
+            f"{len(new_configs) - len(added) - len(changed)} unchanged", 1)
+
+    def run(self):
+        """run the due jobs until interrupted"""
+        while True:
+            # Sleep exactly until the next job is due
+            self.scheduler.wait()
+            if self._reload_requested.is_set():
+                self._reload_requested.clear()
+                self.reload()
+            for job in self.scheduler.pop_due():
+                if not job.running:
+                    self.dispatch(job)
+                elif job.overrun == 'coalesce':
+                    log(f"Config {job.name} is still running, coalescing this run", 2)
+                    job.pending = True
+                else:
+                    log(f"Config {job.name} is still running, skipping this run", 2)
+
+    def run_once(self):
+        """run every configuration set once, returns the number of failed runs"""
+        futures = self.engine.run([
+            (host_of(final_config.get('url')), timed_process_config,
+             (self.pool, final_config, name, self.states[name]))
+            for name, final_config in self.final_configs.items()])
+        failed = 0
+        for future in futures:
+            # unlike the circuit breaker, a batch run also fails if the broker did not
+            # acknowledge all messages or could not be reached (ok is None)
+            if future.exception() is not None or not future.result().ok:
+                failed += 1
+        log(f"Batch run finished: {len(futures) - failed} configuration set(s) succeeded, " \
+            f"{failed} failed", 2)
+        return failed
+
+    def shutdown(self):
+        """stop the engine and close all connections"""
+        self.engine.shutdown()
+        self.pool.close_all()
+        # the HTTP client is only loaded if a source needed it
+        httpclient = sys.modules.get('httpclient')
+        if httpclient is not None:
+            httpclient.sessions.close_all()
 
 def main():
     """The main function"""
@@ -236,14 +851,36 @@ def main():
         requests ('false' to disable, or path to a custom CA bundle).")
     parser.add_argument("--interval", type=int, help="Interval in seconds to repeatedly fetch \
         data from the URL or file (optional).")
+    parser.add_argument("--timeout", type=float, help=f"Timeout in seconds for fetching data \
+        from a URL (default: {DEFAULT_TIMEOUT}).")
+    parser.add_argument("--engine", type=str, choices=ENGINES, help="Execution engine for the \
+        configuration sets: 'sequential' or 'threads' to fetch them concurrently \
+        (default: sequential).")
+    parser.add_argument("--max-workers", type=int, help="Maximum number of configuration sets \
+        processed at the same time by the 'threads' engine.")
+    parser.add_argument("--per-host-limit", type=int, help="Maximum number of concurrent \
+        requests to the same host with the 'threads' engine.")
+    parser.add_argument("--watch", action="store_true", help="Reload the configuration file \
+        whenever it changes, without restarting.")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this \
+        port at /metrics (optional).")
+    parser.add_argument("--workers", type=int, help="Number of worker processes the \
+        configuration sets are distributed across (optional).")
+    parser.add_argument("--once", action="store_true", help="Run every configuration set once, \
+        concurrently, and exit when all messages are delivered (for cron jobs).")
+    parser.add_argument("--no-config-cache", action="store_true", help="Always parse the \
+        configuration file instead of using the cached copy.")
+    parser.add_argument("--shard", type=str, help=argparse.SUPPRESS)
 
     args = parser.parse_args()
 
     # Load configurations from a file if provided
 
     config_sets = []
+    settings = {}
     if args.configfile:
-        configurations = load_config_file(args.configfile)
+        configurations, settings = load_config_file(args.configfile,
+                                                    use_cache=not args.no_config_cache)
 
         # Default to --config="all" if --config is not specified
         if not args.config:
@@ -256,53 +893,63 @@ def main():
             config_sets = [get_config_by_name(configurations, name) for name in config_names]
     else:
         # If no configfile is provided, create a single configuration from command-line arguments
-        config_sets = [vars(args)]
-        config_name = "commandline"
+        config_sets = [{**vars(args), 'name': "commandline"}]
 
-    # Dictionary to store the next execution time for each config
-    next_run_times = {}
+    # Distribute the configuration sets across worker processes
+    workers = args.workers or settings.get('workers')
+    if workers and workers > 1 and args.configfile and not args.shard and not args.once:
+        log(f"Starting {workers} worker processes", 1)
+        supervisor = Supervisor(os.path.abspath(__file__), sys.argv[1:], workers)
+        try:
+            supervisor.run()
+        except KeyboardInterrupt:
+            log("Shutting down.", 1)
+        finally:
+            supervisor.stop()
+        return
 
-    # Initialize next_run_times with the current time for all configs
-    current_time = time.time()
-    for config in config_sets:
-        # check if a "name" key is found in the configuration
-        if 'name' not in config:
-            log(f"Error: Missing 'name' key in one of the configuration sets: {config}", 1)
-            continue  # skipping this configuration set
+    # Expose the metrics of all configuration sets, every worker on its own port
+    metrics_port = args.metrics_port or settings.get('metrics_port') or os.getenv('METRICSPORT')
+    if metrics_port:
+        shard_index = parse_shard(args.shard)[0] if args.shard else 0
+        metrics.start_metrics_server(int(metrics_port) + shard_index)
 
-        interval = config.get('interval')
-        if interval:
-            next_run_times[config['name']] = current_time + interval
-        else:
-            next_run_times[config['name']] = current_time  # Execute immediately if no interval
-
-    while True:
-        current_time = time.time()
-        for config in config_sets:
-            config_name = config.get('name', "commandline")
-            next_run_time = next_run_times.get(config_name)
-
-            if next_run_time and current_time >= next_run_time:
-                # Execute the config
-                final_config = merge_configs(config, vars(args))
-                mqtt_version = config.get('mqtt_version', 'v3.1.1')  # Default to v3.1.1
-                log(f"Using MQTT version '{mqtt_version}'", 15)
-                if mqtt_version == "v5":
-                    client = mqtt.Client(protocol=mqtt.MQTTv5)
-                else:
-                    client = mqtt.Client(protocol=mqtt.MQTTv311)
-                client.username_pw_set(final_config.get('mqttuser', ''), \
-                    final_config.get('mqttpassword', ''))
-                process_config(client, final_config, config_name)
+    # Without periodic configuration sets there is nothing to wait for after one run
+    periodic = any(merge_configs(config, vars(args)).get('interval') for config in config_sets)
+    batch = args.once or not (periodic or args.watch)
 
-                # Update the next run time
-                interval = final_config.get('interval')
-                if interval:
-                    next_run_times[config_name] = current_time + interval
+    runner = Runner(args, settings)
+    for config in config_sets:
+        if runner.owns(config):
+            runner.add_config(config, schedule=not batch)
 
-        # Sleep for a short period to avoid busy waiting
-        time.sleep(1)
+    if batch:
+        try:
+            failed = runner.run_once()
+        except KeyboardInterrupt:
+            log("Shutting down.", 1)
+            failed = 1
+        finally:
+            runner.shutdown()
+        sys.exit(1 if failed else 0)
+
+    # Reload the configuration file in-process when it changes
+    watcher = None
+    if args.watch and args.configfile:
+        from configwatch import ConfigWatcher
+        watcher = ConfigWatcher(args.configfile, runner.request_reload)
+        watcher.start()
+    if hasattr(signal, 'SIGHUP') and args.configfile:
+        signal.signal(signal.SIGHUP, lambda *_: runner.request_reload())
 
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        log("Shutting down.", 1)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        runner.shutdown()
 
 
 if __name__ == "__main__":
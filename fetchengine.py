@@ -0,0 +1,132 @@
+"""execution engines running the configuration sets that are due"""
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+from logger import log
+
+ENGINES = ['sequential', 'threads']
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST_LIMIT = 2
+
+def host_of(url):
+    """return the host a URL points to, or None for local files"""
+    parsed_url = urlparse(url or '')
+    if parsed_url.scheme == 'file':
+        return None
+    return parsed_url.netloc or None
+
+def _log_failure(future):
+    """log exceptions that escaped a job"""
+    if future.cancelled():
+        return
+    exception = future.exception()
+    if exception is not None:
+        log(f"Error in background job: {exception}", 1)
+
+class SequentialEngine:
+    """runs every job inline, one after another"""
+    def submit(self, host, func, *args):
+        """run func immediately and return a completed future"""
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        _log_failure(future)
+        return future
+
+    def run(self, jobs):
+        """run a list of (host, func, args) jobs, returns their futures"""
+        return [self.submit(host, func, *args) for host, func, args in jobs]
+
+    def shutdown(self):
+        """nothing to clean up"""
+
+class ThreadEngine:
+    """runs jobs on a bounded thread pool with an additional per-host limit"""
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, per_host_limit=DEFAULT_PER_HOST_LIMIT):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="data2mqtt")
+        self.per_host_limit = per_host_limit
+        self._running = {}  # host -> number of its jobs on the pool
+        self._waiting = {}  # host -> deque of (future, func, args) waiting for a slot
+        self._lock = threading.Lock()
+        log(f"Thread engine started with {max_workers} workers, " \
+            f"{per_host_limit} per host", 3)
+
+    def _start(self, host, future, func, args):
+        """hand a job that holds a slot of its host to the thread pool"""
+        try:
+            self.executor.submit(self._run_limited, host, future, func, args)
+        except RuntimeError:
+            # the engine was shut down
+            future.cancel()
+            self._release(host)
+
+    def _run_limited(self, host, future, func, args):
+        """run func and pass the slot of its host on to the next waiting job"""
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            self._release(host)
+
+    def _release(self, host):
+        """free a slot of host, or give it to the job that waits longest for it"""
+        with self._lock:
+            waiting = self._waiting.get(host)
+            if waiting:
+                job = waiting.popleft()
+            else:
+                job = None
+                self._running[host] -= 1
+                if not self._running[host]:
+                    del self._running[host]
+                    self._waiting.pop(host, None)
+        if job is not None:
+            self._start(host, *job)
+
+    def submit(self, host, func, *args):
+        """queue func on the thread pool and return its future"""
+        if host is None or not self.per_host_limit:
+            future = self.executor.submit(func, *args)
+        else:
+            # jobs waiting for a busy host must not block a worker of the pool
+            future = Future()
+            with self._lock:
+                start = self._running.get(host, 0) < self.per_host_limit
+                if start:
+                    self._running[host] = self._running.get(host, 0) + 1
+                else:
+                    self._waiting.setdefault(host, deque()).append((future, func, args))
+            if start:
+                self._start(host, future, func, args)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def run(self, jobs):
+        """run (host, func, args) jobs, wait until all are done and return their futures"""
+        futures = [self.submit(host, func, *args) for host, func, args in jobs]
+        wait(futures)
+        return futures
+
+    def shutdown(self):
+        """stop the worker threads and drop the jobs waiting for a host"""
+        with self._lock:
+            waiting = [job for jobs in self._waiting.values() for job in jobs]
+            self._waiting.clear()
+        for future, _, _ in waiting:
+            future.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def create_engine(name, max_workers=None, per_host_limit=None):
+    """create the execution engine selected by name"""
+    if name == 'threads':
+        return ThreadEngine(max_workers or DEFAULT_MAX_WORKERS,
+                            per_host_limit if per_host_limit is not None \
+                                else DEFAULT_PER_HOST_LIMIT)
+    return SequentialEngine()
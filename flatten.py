@@ -0,0 +1,141 @@
+"""iterative flattening of nested documents into (key, value) pairs"""
+from logger import log
+
+ARRAY_MODES = ['string', 'index', 'key']
+
+class Flattener:
+    """flattens dicts and lists without recursion and caches the topic plan of a document"""
+    def __init__(self, arrays='string', array_key=None, separator='.', use_plan=True,
+                 rules=None):
+        self.arrays = arrays if arrays in ARRAY_MODES else 'string'
+        self.array_key = array_key
+        self.separator = separator
+        self.rules = rules
+        self.use_plan = use_plan
+        self._plan = None
+        self._plan_root = None
+
+    def _is_container(self, value):
+        """True if value is walked into instead of being published"""
+        return isinstance(value, dict) or (isinstance(value, list) and self.arrays != 'string')
+
+    def accepts(self, obj):
+        """True if obj can be flattened"""
+        return isinstance(obj, dict) or (isinstance(obj, list) and self.arrays != 'string')
+
+    def _label(self, index, item):
+        """topic component of a list element"""
+        if self.arrays == 'key' and isinstance(item, dict) and self.array_key in item:
+            return str(item[self.array_key])
+        return str(index)
+
+    def _children(self, obj):
+        """return the (accessor, label, value) triples of a container"""
+        if isinstance(obj, dict):
+            return [(key, str(key), value) for key, value in obj.items()]
+        return [(index, self._label(index, item), item) for index, item in enumerate(obj)]
+
+    # The topic plan mirrors the structure of the last document: every dict or
+    # list node stores its length and, per element, the precomputed target of a
+    # leaf or the node of a nested container. As long as a new document has
+    # the same shape, its leaves are collected along the plan without
+    # building any key or evaluating any rule again.
+    @staticmethod
+    def _node(obj, kind=None):
+        """create an empty plan node for a container"""
+        if kind is None:
+            kind = 'd' if isinstance(obj, dict) else 'l'
+        return (kind, len(obj), [])
+
+    def _walk(self, obj, parent_key):
+        """flatten obj and build the topic plan on the way"""
+        leaves = []
+        list_kind = 'k' if self.arrays == 'key' else 'l'
+        plan = self._node(obj, None if isinstance(obj, dict) else list_kind)
+        stack = [(iter(self._children(obj)), parent_key, plan[2])]
+        while stack:
+            children, key_prefix, entries = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                continue
+            accessor, label, value = child
+            full_key = f"{key_prefix}{self.separator}{label}" if key_prefix else label
+            if self._is_container(value):
+                node = self._node(value, None if isinstance(value, dict) else list_kind)
+                entries.append((accessor, label, None, node))
+                stack.append((iter(self._children(value)), full_key, node[2]))
+            else:
+                target = self._target(full_key)
+                entries.append((accessor, label, target, None))
+                self._emit(leaves, target, value)
+        return leaves, plan
+
+    def _target(self, full_key):
+        """(topic, transform) of a leaf, None if the rules drop it"""
+        if self.rules is None:
+            return full_key, None
+        return self.rules.resolve(full_key)
+
+    @staticmethod
+    def _emit(leaves, target, value):
+        """add a leaf to the result unless it is dropped"""
+        if target is not None:
+            topic, transform = target
+            leaves.append((topic, transform(value) if transform is not None else value))
+
+    @staticmethod
+    def _matches(container, node):
+        """True if container has the type and length recorded in the plan node"""
+        kind, length, _ = node
+        if kind == 'd':
+            return isinstance(container, dict) and len(container) == length
+        return isinstance(container, list) and len(container) == length
+
+    def _apply_plan(self, obj):
+        """collect the leaves of obj along the plan, None if the shape differs"""
+        if not self._matches(obj, self._plan):
+            return None
+        leaves = []
+        stack = [(obj, self._plan[0], iter(self._plan[2]))]
+        while stack:
+            container, kind, entries = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            accessor, label, target, node = entry
+            try:
+                value = container[accessor]
+            except (KeyError, IndexError):
+                return None
+            if kind == 'k' and self._label(accessor, value) != label:
+                return None
+            if node is None:
+                if self._is_container(value):
+                    return None
+                self._emit(leaves, target, value)
+            elif self._matches(value, node):
+                stack.append((value, node[0], iter(node[2])))
+            else:
+                return None
+        return leaves
+
+    def flatten(self, obj, parent_key=""):
+        """return the list of (key, value) pairs of all leaves in obj"""
+        if self.use_plan and self._plan is not None and self._plan_root == parent_key:
+            leaves = self._apply_plan(obj)
+            if leaves is not None:
+                return leaves
+            log("Document structure changed, rebuilding topic plan", 4)
+        leaves, plan = self._walk(obj, parent_key)
+        if self.use_plan:
+            self._plan = plan
+            self._plan_root = parent_key
+        return leaves
+
+def create_flattener(config, rules=None):
+    """create the flattener of a configuration set"""
+    return Flattener(config.get('arrays', 'string'), config.get('array_key'),
+                     config.get('topic_separator') or '.',
+                     use_plan=config.get('topic_plan', True), rules=rules)
@@ -0,0 +1,91 @@
+"""circuit breaker and adaptive polling interval of a configuration set"""
+import time
+from collections import namedtuple
+from logger import log
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_BACKOFF_MAX = 300
+CHANGE_RATE_WEIGHT = 0.3   # weight of the latest run in the change rate
+LATENCY_SHARE = 0.5        # a run may take at most this share of the interval
+
+# outcome of a run: ok is None if the source was not at fault (e.g. the broker was down)
+RunOutcome = namedtuple('RunOutcome', ['ok', 'changed', 'seconds'])
+
+class SourceHealth:
+    """opens a circuit after consecutive failures and adapts the interval to the source"""
+    def __init__(self, name, interval, min_interval=None, max_interval=None,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, backoff_max=DEFAULT_BACKOFF_MAX):
+        self.name = name
+        self.base_interval = interval
+        self.interval = interval
+        self.adaptive = min_interval is not None or max_interval is not None
+        self.min_interval = min_interval if min_interval is not None else interval
+        self.max_interval = max_interval if max_interval is not None else interval
+        self.failure_threshold = failure_threshold
+        self.backoff_max = backoff_max
+        self.failures = 0
+        self.backoff = None
+        self.retry_at = None       # the circuit is open until then
+        self.change_rate = 1.0     # start at the fastest rate until the source is known
+
+    @property
+    def is_open(self):
+        """True while runs are short-circuited"""
+        return self.retry_at is not None
+
+    def allow(self, now=None):
+        """True if the source may be fetched, after the backoff one trial run is allowed"""
+        if self.retry_at is None:
+            return True
+        now = time.time() if now is None else now
+        return now >= self.retry_at
+
+    def _failed(self, now):
+        """count a failed run and open the circuit when the threshold is reached"""
+        self.failures += 1
+        if not self.failure_threshold or self.failures < self.failure_threshold:
+            return
+        if self.backoff is None:
+            self.backoff = min(self.base_interval, self.backoff_max)
+        else:
+            self.backoff = min(self.backoff * 2, self.backoff_max)
+        self.retry_at = now + self.backoff
+        log(f"Config {self.name}: {self.failures} consecutive failures, pausing for " \
+            f"{self.backoff:g} seconds", 1)
+
+    def _succeeded(self):
+        """close the circuit after a successful run"""
+        if self.retry_at is not None:
+            log(f"Config {self.name}: source recovered, resuming normal polling", 1)
+        self.failures = 0
+        self.backoff = None
+        self.retry_at = None
+
+    def _adapt(self, changed, seconds):
+        """move the interval between its bounds following the change rate and the latency"""
+        self.change_rate += CHANGE_RATE_WEIGHT * ((1.0 if changed else 0.0) - self.change_rate)
+        interval = self.max_interval - (self.max_interval - self.min_interval) * self.change_rate
+        # slow sources are not polled more often than their latency allows
+        interval = max(interval, seconds / LATENCY_SHARE)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+
+    def record(self, outcome, now=None):
+        """update the health with the outcome of a run, returns the next interval"""
+        now = time.time() if now is None else now
+        if outcome.ok is False:
+            self._failed(now)
+        elif outcome.ok:
+            self._succeeded()
+            if self.adaptive:
+                self._adapt(outcome.changed, outcome.seconds)
+        return self.interval
+
+def create_health(config):
+    """create the health tracking of a periodic configuration set, None for one-shot runs"""
+    interval = config.get('interval')
+    if not interval:
+        return None
+    return SourceHealth(config.get('name', "commandline"), interval,
+                        config.get('min_interval'), config.get('max_interval'),
+                        config.get('failure_threshold', DEFAULT_FAILURE_THRESHOLD),
+                        config.get('backoff_max', DEFAULT_BACKOFF_MAX))
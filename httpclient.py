@@ -0,0 +1,75 @@
+"""pooled HTTP sessions with conditional requests"""
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from logger import log
+
+# urllib3 only decodes brotli if one of the brotli packages is available
+try:
+    import brotli  # pylint: disable=unused-import
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # pylint: disable=unused-import
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_POOL_MAXSIZE = 10
+
+class SessionPool:
+    """one keep-alive session per host"""
+    def __init__(self, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, url):
+        """return the session for the host of url"""
+        parsed_url = urlparse(url)
+        host_key = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        with self._lock:
+            session = self._sessions.get(host_key)
+            if session is None:
+                log(f"Opening new HTTP session for {host_key}", 4)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                session.mount(host_key, adapter)
+                session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+                self._sessions[host_key] = session
+            return session
+
+    def get(self, url, auth=None, verify=True, timeout=None, conditional=False, stream=False,
+            validators=None):
+        """GET url, returns None if the source has not changed since the last request"""
+        # the validators belong to one configuration set, a 304 only answers for that set
+        headers = {}
+        if conditional and validators is not None:
+            etag, last_modified = validators.get(url, (None, None))
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = self.get_session(url).get(url, auth=auth, verify=verify, timeout=timeout,
+                                             headers=headers, stream=stream)
+        if response.status_code == 304:
+            log(f"{url} has not been modified", 3)
+            response.close()
+            return None
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if validators is not None and (etag or last_modified):
+            validators[url] = (etag, last_modified)
+        return response
+
+    def close_all(self):
+        """close all sessions"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+sessions = SessionPool()
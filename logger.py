@@ -1,12 +1,72 @@
 from datetime import datetime
+import atexit
+import json
 import os
+import queue
+import sys
+import threading
 
 LOGLEVEL = int(os.getenv("LOGLEVEL", "0"))
+LOGFORMAT = os.getenv("LOGFORMAT", "text").lower()  # 'text' or 'json' (JSON lines)
+LOGASYNC = os.getenv("LOGASYNC", "false").lower() in ("1", "true", "yes")
 
-def log(message, level):
-    """Log messages with a timestamp and log level based on the current log level."""
+def is_enabled(level):
+    """Fast check whether messages of the given level are logged, for use in hot paths."""
+    return LOGLEVEL >= level
+
+def _format(message, level, fields):
+    """Render a log line as text or as a JSON object."""
+    now = datetime.now()
+    if LOGFORMAT == "json":
+        return json.dumps({"time": now.isoformat(timespec='milliseconds'), "level": level,
+                           "message": message, **fields}, default=str)
+    # text messages already contain the values of the fields
+    timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    return f"{timestamp} [{level}] {message}"
+
+def _print_line(line):
+    """Write a log line to stdout."""
+    print(line)
+
+class _QueueWriter:
+    """Writes log lines from a background thread so callers never block on stdout."""
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="logger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        """Print queued lines until the end marker arrives."""
+        while True:
+            line = self.queue.get()
+            if line is None:
+                break
+            print(line)
+        sys.stdout.flush()
+
+    def write(self, line):
+        """Queue a line without waiting for stdout."""
+        self.queue.put(line)
+
+    def close(self):
+        """Flush all pending lines before the interpreter exits."""
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+_write = _QueueWriter().write if LOGASYNC else _print_line
+
+def log(message, level, *args, **fields):
+    """Log messages with a timestamp and log level based on the current log level.
+
+    The message is only rendered if the level is enabled: it may be a
+    %-format string for args or a callable returning the message.
+    Keyword arguments are added as structured fields in JSON mode.
+    """
     if LOGLEVEL < level:
         return
-    else:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"{timestamp} [{level}] {message}")
+    if callable(message):
+        message = message()
+    elif args:
+        message = message % args
+    _write(_format(message, level, fields))
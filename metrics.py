@@ -0,0 +1,161 @@
+"""Prometheus metrics of the fetch, parse and publish stages"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger import log
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    """escape a label value for the text exposition format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, labelvalues, extra=""):
+    """render the label set of a sample"""
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+class Counter:
+    """a monotonically increasing value per label set"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """increase the counter of the given labels"""
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """yield the lines of the exposition format"""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {value}"
+
+class Histogram:
+    """observations counted in cumulative buckets per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """record an observation"""
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """observe the duration of a with block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        """yield the lines of the exposition format"""
+        with self._lock:
+            values = {key: list(data) for key, data in self._values.items()}
+        for key, data in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {data[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {data[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {data[-1]}"
+
+class Registry:
+    """collection of all metrics"""
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """add a metric to the registry"""
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+fetch_seconds = registry.register(Histogram(
+    'data2mqtt_fetch_seconds', "Time to fetch the data of a source.", ['config']))
+parse_seconds = registry.register(Histogram(
+    'data2mqtt_parse_seconds', "Time to parse and flatten the data of a source.", ['config']))
+publish_seconds = registry.register(Histogram(
+    'data2mqtt_publish_seconds', "Time to wait for the delivery of the messages of a run.",
+    ['config']))
+run_seconds = registry.register(Histogram(
+    'data2mqtt_run_seconds', "Total time of a run of a configuration set.", ['config']))
+schedule_lag_seconds = registry.register(Histogram(
+    'data2mqtt_schedule_lag_seconds', "Delay between the scheduled and the actual start of a run.",
+    ['config']))
+leaves_per_run = registry.register(Histogram(
+    'data2mqtt_leaves', "Number of data points found per run.", ['config'], COUNT_BUCKETS))
+messages = registry.register(Counter(
+    'data2mqtt_messages', "MQTT messages by delivery result.", ['config', 'result']))
+errors = registry.register(Counter(
+    'data2mqtt_errors', "Errors by processing stage.", ['config', 'stage']))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """serves /metrics"""
+    def do_GET(self):  # pylint: disable=invalid-name
+        """answer a scrape request"""
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """route the access log through the data2mqtt logger"""
+        log("metrics: " + format, 20, *args)
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """serve /metrics on a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log(f"Serving metrics on http://{host}:{port}/metrics", 2)
+    return server
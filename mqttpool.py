@@ -0,0 +1,125 @@
+"""pooled, long-lived MQTT connections shared by all configuration sets"""
+import threading
+import paho.mqtt.client as mqtt
+from logger import log
+
+class BrokerConnection:
+    """a single long-lived MQTT client running its own network loop"""
+    def __init__(self, key, keepalive, min_backoff, max_backoff):
+        host, port, mqtt_version, username, password = key
+        self.key = key
+        self.host = host
+        self.port = port
+        self.connected = threading.Event()
+        self.first_attempt_done = False  # later outages fail at once while paho reconnects
+        if mqtt_version == "v5":
+            self.client = mqtt.Client(protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(protocol=mqtt.MQTTv311)
+        self.client.username_pw_set(username or '', password or '')
+        # paho retries with an exponential backoff between min and max delay
+        self.client.reconnect_delay_set(min_delay=min_backoff, max_delay=max_backoff)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.connect_async(host, port, keepalive)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        """connection callback of the paho network loop"""
+        if rc == 0:
+            log(f"Connected to MQTT server {self.host}:{self.port}", 3)
+            self.connected.set()
+        else:
+            log(f"Error connecting to the MQTT server {self.host}:{self.port}: {rc}", 1)
+
+    def _on_disconnect(self, client, userdata, *args):
+        """disconnect callback, paho reconnects on its own"""
+        self.connected.clear()
+        log(f"Disconnected from MQTT server {self.host}:{self.port}, reconnecting", 2)
+
+    def wait_connected(self, timeout):
+        """wait for the first connection only, afterwards report the current state at once"""
+        if self.first_attempt_done:
+            return self.connected.is_set()
+        connected = self.connected.wait(timeout)
+        self.first_attempt_done = True
+        return connected
+
+    def close(self):
+        """disconnect and stop the network loop"""
+        try:
+            self.client.disconnect()
+        finally:
+            self.client.loop_stop()
+        log(f"Closed connection to MQTT server {self.host}:{self.port}", 3)
+
+class BrokerPool:
+    """keeps one connection per (host, port, protocol version, credentials)"""
+    def __init__(self, keepalive=60, connect_timeout=10, min_backoff=1, max_backoff=120):
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._connections = {}
+        self._owners = {}  # configuration set name -> key of the connection it uses
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(host, port, mqtt_version, username, password):
+        """build the pool key of a broker connection"""
+        return (host, port, mqtt_version or 'v3.1.1', username or '', password or '')
+
+    def get_connection(self, key, owner=None):
+        """return the pooled connection for key, creating it if needed"""
+        unused = None
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is None:
+                log(f"Opening new connection to MQTT server {key[0]}:{key[1]}", 3)
+                connection = BrokerConnection(key, self.keepalive,
+                                              self.min_backoff, self.max_backoff)
+                self._connections[key] = connection
+            if owner is not None:
+                old_key = self._owners.get(owner)
+                self._owners[owner] = key
+                if old_key is not None and old_key != key:
+                    unused = self._pop_unused(old_key)
+        if unused is not None:
+            unused.close()
+        return connection
+
+    def _pop_unused(self, key):
+        """remove the connection for key from the pool if no owner uses it anymore"""
+        if key in self._owners.values():
+            return None
+        return self._connections.pop(key, None)
+
+    def release(self, owner):
+        """release the connection of owner, closing it if nobody else uses it"""
+        with self._lock:
+            key = self._owners.pop(owner, None)
+            unused = self._pop_unused(key) if key is not None else None
+        if unused is not None:
+            unused.close()
+
+    def get_client(self, host, port, mqtt_version=None, username=None, password=None,
+                   owner=None):
+        """return a connected client, raise ConnectionError if the broker is unreachable"""
+        key = self.make_key(host, port, mqtt_version, username, password)
+        connection = self.get_connection(key, owner)
+        if not connection.wait_connected(self.connect_timeout):
+            raise ConnectionError(f"MQTT server {host}:{port} not reachable, " \
+                                  "retrying in the background")
+        return connection.client
+
+    def close_all(self):
+        """close every pooled connection"""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+            self._owners.clear()
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception as e:
+                log(f"Error closing MQTT connection: {e}", 1)
@@ -0,0 +1,239 @@
+"""pagination of REST sources and high-water-mark cursors"""
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+from logger import log
+
+PAGINATION_TYPES = ['link', 'page', 'offset', 'cursor']
+DEFAULT_MAX_PAGES = 100
+DEFAULT_CONCURRENCY = 1
+
+def get_path(obj, path):
+    """value at a dotted path of a document, None if it does not exist"""
+    if not path:
+        return obj
+    for key in path.split('.'):
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        elif isinstance(obj, list) and key.isdigit() and int(key) < len(obj):
+            obj = obj[int(key)]
+        else:
+            return None
+    return obj
+
+def replace_path(obj, path, value):
+    """copy of a document with the value at a dotted path replaced"""
+    if not path:
+        return value
+    key, _, rest = path.partition('.')
+    if not isinstance(obj, dict) or key not in obj:
+        return obj
+    return {**obj, key: replace_path(obj[key], rest, value)}
+
+def with_params(url, params):
+    """url with the given query parameters added or replaced"""
+    parsed_url = urlparse(url)
+    query = dict(parse_qsl(parsed_url.query, keep_blank_values=True))
+    query.update({name: str(value) for name, value in params.items() if value is not None})
+    return urlunparse(parsed_url._replace(query=urlencode(query)))
+
+def prefetch(fetch, urls, concurrency):
+    """fetch urls with up to concurrency requests in flight, yield the responses in order"""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency),
+                            thread_name_prefix="pagination") as executor:
+        pending = deque()
+        try:
+            for url in urls:
+                pending.append(executor.submit(fetch, url))
+                if len(pending) >= concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # pages behind the last one are not needed anymore
+            for future in pending:
+                future.cancel()
+
+class CursorStore:
+    """high-water marks of the configuration sets, persisted in a JSON file"""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        """all stored cursors"""
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            log(f"Error reading cursor file {self.path}: {e}", 1)
+            return {}
+
+    def load(self, name):
+        """cursor of a configuration set, None if there is none"""
+        with self._lock:
+            return self._read().get(name)
+
+    def save(self, name, value):
+        """store the cursor of a configuration set"""
+        with self._lock:
+            cursors = self._read()
+            cursors[name] = value
+            with open(self.path + '.tmp', 'w') as file:
+                json.dump(cursors, file, indent=2, default=str)
+            os.replace(self.path + '.tmp', self.path)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def cursor_store(path):
+    """the shared cursor store of a file"""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = CursorStore(path)
+        return store
+
+class Paginator:
+    """builds the page URLs of a source and tracks the newest record published"""
+    def __init__(self, name, kind=None, page_param='page', page_start=1, page_size=None,
+                 page_size_param=None, offset_param='offset', cursor_param='cursor',
+                 cursor_field=None, records_field=None, max_pages=DEFAULT_MAX_PAGES,
+                 concurrency=DEFAULT_CONCURRENCY, since_field=None, since_param=None,
+                 store=None):
+        self.name = name
+        self.kind = kind
+        self.page_param = page_param
+        self.page_start = page_start
+        self.page_size = page_size
+        self.page_size_param = page_size_param
+        self.offset_param = offset_param
+        self.cursor_param = cursor_param
+        self.cursor_field = cursor_field
+        self.records_field = records_field
+        self.max_pages = max_pages
+        self.concurrency = concurrency if kind in ('page', 'offset') else 1
+        self.since_field = since_field
+        self.since_param = since_param
+        self.store = store
+        self.high_water_mark = store.load(name) if store is not None else None
+        self._newest = self.high_water_mark
+
+    @property
+    def needs_document(self):
+        """True if the pages have to be inspected as JSON documents"""
+        return self.kind in ('page', 'offset', 'cursor') or self.since_field is not None
+
+    def first_url(self, url):
+        """URL of the first page, asking only for records newer than the high-water mark"""
+        params = {}
+        if self.page_size_param and self.page_size:
+            params[self.page_size_param] = self.page_size
+        if self.since_param and self.high_water_mark is not None:
+            params[self.since_param] = self.high_water_mark
+        return with_params(url, params) if params else url
+
+    def page_urls(self, url):
+        """URLs of the numbered pages of a page or offset source"""
+        first_url = self.first_url(url)
+        for index in range(self.max_pages):
+            if self.kind == 'page':
+                yield with_params(first_url, {self.page_param: self.page_start + index})
+            else:
+                yield with_params(first_url, {self.offset_param: index * (self.page_size or 0)})
+
+    def records(self, document):
+        """the list of records of a page, None if the page has none"""
+        records = get_path(document, self.records_field)
+        return records if isinstance(records, list) else None
+
+    def is_last(self, document):
+        """True if no page follows the page of this document"""
+        records = self.records(document)
+        if not records:
+            return True
+        return bool(self.page_size) and len(records) < self.page_size
+
+    def next_url(self, url, response, document):
+        """URL of the page after a link or cursor page, None after the last page"""
+        if self.kind == 'link':
+            next_link = response.links.get('next', {}).get('url')
+            return urljoin(response.url, next_link) if next_link else None
+        if self.kind == 'cursor':
+            cursor = get_path(document, self.cursor_field)
+            if not cursor or (self.records_field and not self.records(document)):
+                return None
+            return with_params(self.first_url(url), {self.cursor_param: cursor})
+        return None
+
+    def _is_new(self, record):
+        """True if a record is newer than the high-water mark, remembers the newest"""
+        value = get_path(record, self.since_field)
+        if value is None:
+            return True
+        try:
+            if self.high_water_mark is not None and value <= self.high_water_mark:
+                return False
+            if self._newest is None or value > self._newest:
+                self._newest = value
+        except TypeError:
+            log(f"Cannot compare '{self.since_field}' value {value!r} with the cursor", 1)
+        return True
+
+    def new_records(self, document):
+        """the document with only the records newer than the high-water mark"""
+        if self.since_field is None:
+            return document
+        records = self.records(document)
+        if records is None:
+            return document
+        return replace_path(document, self.records_field,
+                            [record for record in records if self._is_new(record)])
+
+    def rollback(self):
+        """keep the high-water mark, the records of this run are fetched again"""
+        self._newest = self.high_water_mark
+
+    def commit(self):
+        """advance the high-water mark after all pages have been published"""
+        if self._newest == self.high_water_mark:
+            return
+        self.high_water_mark = self._newest
+        log(f"Config {self.name}: cursor advanced to {self.high_water_mark}", 3)
+        if self.store is not None:
+            try:
+                self.store.save(self.name, self.high_water_mark)
+            except OSError as e:
+                log(f"Error saving cursor file {self.store.path}: {e}", 1)
+
+def create_paginator(config):
+    """create the paginator of a configuration set, None for single requests"""
+    kind = config.get('pagination')
+    if kind is None and not config.get('since_field'):
+        return None
+    if kind is not None and kind not in PAGINATION_TYPES:
+        log(f"Unknown pagination '{kind}', fetching a single page", 1)
+        kind = None
+    if kind == 'offset' and not config.get('page_size'):
+        log("Offset pagination needs 'page_size', fetching a single page", 1)
+        kind = None
+    store = cursor_store(config['cursor_file']) if config.get('cursor_file') else None
+    return Paginator(config.get('name', "commandline"), kind,
+                     page_param=config.get('page_param', 'page'),
+                     page_start=config.get('page_start', 1),
+                     page_size=config.get('page_size'),
+                     page_size_param=config.get('page_size_param'),
+                     offset_param=config.get('offset_param', 'offset'),
+                     cursor_param=config.get('cursor_param', 'cursor'),
+                     cursor_field=config.get('cursor_field'),
+                     records_field=config.get('records_field'),
+                     max_pages=config.get('max_pages') or DEFAULT_MAX_PAGES,
+                     concurrency=config.get('page_concurrency') or DEFAULT_CONCURRENCY,
+                     since_field=config.get('since_field'),
+                     since_param=config.get('since_param'),
+                     store=store)
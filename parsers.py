@@ -0,0 +1,148 @@
+"""parser registry choosing the fastest available backend per data format"""
+import io
+import json
+import threading
+from logger import log
+
+def _orjson():
+    """orjson, the fastest JSON parser"""
+    import orjson
+    return orjson.loads
+
+def _ujson():
+    """ujson, faster than the standard library"""
+    import ujson
+    return ujson.loads
+
+def _json():
+    """JSON parser of the standard library"""
+    return json.loads
+
+def _libyaml():
+    """PyYAML with the libyaml C extension"""
+    import yaml
+    loader = yaml.CSafeLoader  # raises AttributeError without libyaml
+    return lambda data: yaml.load(data, Loader=loader)
+
+def _pyyaml():
+    """pure Python PyYAML"""
+    import yaml
+    return yaml.safe_load
+
+def _qualified_name(name, prefix):
+    """xmltodict style name of a tag or attribute"""
+    local_name = name.rsplit('}', 1)[-1]
+    return f"{prefix}:{local_name}" if prefix else local_name
+
+def _attribute_name(name, element):
+    """xmltodict style name of an attribute, namespaced ones keep their prefix"""
+    if not name.startswith('{'):
+        return name
+    uri = name[1:].split('}', 1)[0]
+    prefix = next((prefix for prefix, namespace in element.nsmap.items()
+                   if namespace == uri and prefix), None)
+    return _qualified_name(name, prefix)
+
+def _add_child(parent, key, value):
+    """add a value to a dict the way xmltodict does, repeated keys become lists"""
+    if key not in parent:
+        parent[key] = value
+    elif isinstance(parent[key], list):
+        parent[key].append(value)
+    else:
+        parent[key] = [parent[key], value]
+
+def _lxml():
+    """lxml iterparse, building the same structure as xmltodict"""
+    from lxml import etree
+
+    def parse(data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        root = {}
+        stack = [root]
+        declarations = {}  # namespaces declared by the next element
+        for event, item in etree.iterparse(io.BytesIO(data),
+                                           events=('start-ns', 'start', 'end'),
+                                           resolve_entities=False, huge_tree=True):
+            if event == 'start-ns':
+                prefix, uri = item
+                declarations['@xmlns:' + prefix if prefix else '@xmlns'] = uri
+                continue
+            element = item
+            if event == 'start':
+                # xmltodict keeps namespace declarations as attributes
+                node = declarations
+                declarations = {}
+                for name, value in element.attrib.items():
+                    node['@' + _attribute_name(name, element)] = value
+                stack.append(node)
+                continue
+            node = stack.pop()
+            # xmltodict joins the text of an element with the tails of its children
+            text = ''.join([element.text or ''] + [child.tail or '' for child in element])
+            text = text.strip()
+            if text and node:
+                node['#text'] = text
+            value = node or text or None
+            _add_child(stack[-1], _qualified_name(element.tag, element.prefix), value)
+            # the tail belongs to the text of the parent, which is not complete yet
+            element.clear(keep_tail=True)
+        return root
+    return parse
+
+def _xmltodict():
+    """xmltodict on top of expat"""
+    import xmltodict
+    return xmltodict.parse
+
+# backends of every format, fastest first
+BACKENDS = {
+    'json': [('orjson', _orjson), ('ujson', _ujson), ('json', _json)],
+    'yaml': [('libyaml', _libyaml), ('pyyaml', _pyyaml)],
+    'xml': [('lxml', _lxml), ('xmltodict', _xmltodict)],
+}
+
+class ParserRegistry:
+    """resolves the parse function of every format once and caches it"""
+    def __init__(self, backends=None):
+        self.backends = backends or BACKENDS
+        self._resolved = {}
+        self._lock = threading.RLock()
+
+    def _load(self, data_format, name):
+        """load a backend, None if it is not available"""
+        for backend_name, factory in self.backends.get(data_format, []):
+            if backend_name == name:
+                try:
+                    return factory()
+                except (ImportError, AttributeError):
+                    return None
+        return None
+
+    def get(self, data_format, backend=None):
+        """return the parse function of a format, using backend if it is available"""
+        key = (data_format, backend)
+        parser = self._resolved.get(key)
+        if parser is not None:
+            return parser
+        with self._lock:
+            if backend is not None:
+                parser = self._load(data_format, backend)
+                if parser is None:
+                    log(f"Parser backend '{backend}' for {data_format} is not available", 1)
+                    parser = self.get(data_format)
+            else:
+                for name, _ in self.backends[data_format]:
+                    parser = self._load(data_format, name)
+                    if parser is not None:
+                        log(f"Using parser backend '{name}' for {data_format} data", 3)
+                        break
+            self._resolved[key] = parser
+        return parser
+
+    def parse(self, data_format, data, backend=None):
+        """parse data of the given format"""
+        return self.get(data_format, backend)(data)
+
+parsers = ParserRegistry()
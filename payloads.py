@@ -0,0 +1,155 @@
+"""payload encoding of single values and of aggregated documents or subtrees"""
+import json
+import struct
+from logger import log
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+PAYLOAD_MODES = ['leaves', 'document', 'both']
+AGGREGATE_FORMATS = ['json', 'msgpack', 'cbor']
+VALUE_ENCODINGS = ['string', 'json', 'fixed', 'struct', 'msgpack']
+DEFAULT_STRUCT_FORMAT = '<d'
+CONTENT_TYPES = {
+    'string': 'text/plain',
+    'json': 'application/json',
+    'fixed': 'text/plain',
+    'struct': 'application/octet-stream',
+    'msgpack': 'application/msgpack',
+}
+
+def _encode_json(obj):
+    """compact JSON encoding"""
+    return json.dumps(obj, separators=(',', ':'), default=str)
+
+def _encode_msgpack(obj):
+    """MessagePack encoding"""
+    return msgpack.packb(obj, default=str)
+
+def _encode_cbor(obj):
+    """CBOR encoding"""
+    return cbor2.dumps(obj, default=lambda encoder, value: encoder.encode(str(value)))
+
+def document_encoder(aggregate_format):
+    """return the function encoding a document in the given format"""
+    if aggregate_format == 'msgpack':
+        if msgpack is not None:
+            return _encode_msgpack
+        log("msgpack is not installed, publishing aggregated payloads as JSON", 1)
+    elif aggregate_format == 'cbor':
+        if cbor2 is not None:
+            return _encode_cbor
+        log("cbor2 is not installed, publishing aggregated payloads as JSON", 1)
+    return _encode_json
+
+def _literal(value):
+    """JSON literal of booleans and null"""
+    if value is None:
+        return 'null'
+    return 'true' if value else 'false'
+
+def _by_type(encoders, fallback):
+    """encoder dispatching on the exact type of the value through a lookup table"""
+    def encode(value):
+        encoder = encoders.get(value.__class__)
+        return encoder(value) if encoder is not None else fallback(value)
+    return encode
+
+def _json_value_encoder():
+    """every value as a JSON document, e.g. 21.5, true, null or a quoted string"""
+    dumps = json.dumps
+    return _by_type({str: dumps, int: int.__repr__, float: dumps, bool: _literal,
+                     type(None): _literal}, lambda value: dumps(value, default=str))
+
+def _fixed_value_encoder(precision):
+    """floats with a fixed number of decimals, strings unchanged"""
+    float_format = f"{{:.{int(precision)}f}}".format
+    return _by_type({str: str, int: int.__repr__, float: float_format, bool: _literal,
+                     type(None): _literal}, str)
+
+def _struct_value_encoder(struct_format):
+    """numbers packed with struct, other values as UTF-8 text"""
+    pack = struct.Struct(struct_format).pack
+    def text(value):
+        return str(value).encode('utf-8')
+    return _by_type({int: pack, float: pack, bool: pack}, text)
+
+def value_encoder(encoding='string', precision=None, struct_format=DEFAULT_STRUCT_FORMAT):
+    """return the function encoding a single value, built once per configuration set"""
+    if encoding == 'json':
+        return _json_value_encoder()
+    if encoding == 'fixed':
+        return _fixed_value_encoder(2 if precision is None else precision)
+    if encoding == 'struct':
+        return _struct_value_encoder(struct_format or DEFAULT_STRUCT_FORMAT)
+    if encoding == 'msgpack':
+        if msgpack is not None:
+            return _encode_msgpack
+        log("msgpack is not installed, publishing values as JSON", 1)
+        return _json_value_encoder()
+    if encoding != 'string':
+        log(f"Unknown payload encoding '{encoding}', publishing values as strings", 1)
+    return str
+
+def create_value_encoder(config):
+    """create the value encoder of a configuration set"""
+    return value_encoder(config.get('payload_encoding', 'string'), config.get('precision'),
+                         config.get('struct_format'))
+
+def iter_subtrees(obj, depth, parent_key="", separator='.', include_scalars=True):
+    """yield (key, subtree) for every value found at the given depth of obj"""
+    # values that are not objects are only yielded if include_scalars is set
+    stack = [(obj, parent_key, 0)]
+    while stack:
+        value, key, level = stack.pop()
+        if level < depth and isinstance(value, dict):
+            for child_key, child in reversed(list(value.items())):
+                full_key = f"{key}{separator}{child_key}" if key else str(child_key)
+                stack.append((child, full_key, level + 1))
+        elif include_scalars or isinstance(value, dict):
+            yield key, value
+
+class Aggregator:
+    """publishes a document, or its subtrees at a given depth, as single messages"""
+    def __init__(self, mode='leaves', depth=0, aggregate_format='json', topic="",
+                 separator='.', default_topic=""):
+        self.mode = mode if mode in PAYLOAD_MODES else 'leaves'
+        self.depth = depth
+        self.topic = topic
+        self.default_topic = default_topic  # used for a document that would have no topic
+        self.separator = separator
+        self.encode = document_encoder(aggregate_format)
+
+    @property
+    def publish_leaves(self):
+        """True if the single values are published as well"""
+        return self.mode != 'document'
+
+    @property
+    def enabled(self):
+        """True if aggregated payloads are published"""
+        return self.mode != 'leaves'
+
+    def messages(self, obj):
+        """yield the (topic, payload) pairs of the aggregated messages of obj"""
+        for key, subtree in iter_subtrees(obj, self.depth, self.topic, self.separator,
+                                          include_scalars=not self.publish_leaves):
+            yield key or self.default_topic, self.encode(subtree)
+
+def create_aggregator(config):
+    """create the aggregator of a configuration set"""
+    # without a prefix the whole document would be published to the empty topic
+    default_topic = "" if config.get('prefix') else config.get('name', "commandline")
+    return Aggregator(config.get('payload_mode', 'leaves'),
+                      config.get('aggregate_depth', 0),
+                      config.get('aggregate_format', 'json'),
+                      config.get('aggregate_topic') or '',
+                      config.get('topic_separator') or '.',
+                      default_topic)
@@ -0,0 +1,118 @@
+"""batched publish pipeline with flow control and delivery accounting"""
+import time
+from collections import deque
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from logger import log
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_INFLIGHT = 1000
+DEFAULT_ACK_TIMEOUT = 10
+
+class Publisher:
+    """publishes the messages of one run in batches and tracks their delivery"""
+    def __init__(self, client, qos=0, retain=False, batch_size=DEFAULT_BATCH_SIZE,
+                 max_inflight=DEFAULT_MAX_INFLIGHT, ack_timeout=DEFAULT_ACK_TIMEOUT,
+                 wait_for_ack=True, properties=None, keep_undelivered=False):
+        self.client = client
+        self.qos = qos
+        self.retain = retain
+        self.batch_size = max(1, batch_size)
+        self.max_inflight = max(1, max_inflight)
+        self.ack_timeout = ack_timeout
+        self.wait_for_ack = wait_for_ack
+        self.properties = properties
+        self.delivered = 0
+        self.failed = 0
+        # failed messages are only kept if the caller asks for them
+        self.undelivered = [] if keep_undelivered else None
+        self._batch = []
+        self._inflight = deque()
+
+    def publish(self, topic, payload):
+        """queue a message, a full batch is handed to the MQTT client"""
+        self._batch.append((topic, payload))
+        if len(self._batch) >= self.batch_size:
+            self._send_batch()
+
+    def _send_batch(self):
+        """hand the queued batch to the client, blocking while the in-flight window is full"""
+        batch = self._batch
+        self._batch = []
+        for topic, payload in batch:
+            while len(self._inflight) >= self.max_inflight:
+                # backpressure: the fetch stage waits until the broker catches up
+                self._wait_oldest(self.ack_timeout)
+            info = self.client.publish(topic, payload, qos=self.qos, retain=self.retain,
+                                       properties=self.properties)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._inflight.append((info, topic, payload))
+            else:
+                self._failed(topic, payload)
+                log(f"Error publishing to MQTT topic {topic}: {mqtt.error_string(info.rc)}", 1)
+        self._collect_published()
+
+    def _collect_published(self):
+        """count the messages at the head of the window that are already delivered"""
+        while self._inflight and self._inflight[0][0].is_published():
+            self._inflight.popleft()
+            self.delivered += 1
+
+    def _wait_oldest(self, timeout):
+        """wait for the oldest message in flight and count its outcome"""
+        info, topic, payload = self._inflight.popleft()
+        try:
+            info.wait_for_publish(timeout)
+        except (RuntimeError, ValueError) as e:
+            log(f"Error publishing to MQTT: {e}", 1)
+        if info.is_published():
+            self.delivered += 1
+        else:
+            self._failed(topic, payload)
+            log(f"MQTT message {info.mid} not acknowledged within {timeout} seconds", 2)
+
+    def _failed(self, topic, payload):
+        """count a message that did not reach the broker"""
+        self.failed += 1
+        if self.undelivered is not None:
+            self.undelivered.append((topic, payload))
+
+    def flush(self):
+        """send the remaining messages and wait for their acknowledgement"""
+        if self._batch:
+            self._send_batch()
+        if self.wait_for_ack:
+            deadline = time.monotonic() + self.ack_timeout
+            while self._inflight:
+                self._wait_oldest(max(0, deadline - time.monotonic()))
+        else:
+            self._collect_published()
+        return self.delivered, self.failed
+
+def create_properties(config, default_content_type=None):
+    """MQTT v5 publish properties of a configuration set, None for older protocol versions"""
+    if config.get('mqtt_version') != 'v5':
+        return None
+    content_type = config.get('mqtt_content_type', default_content_type)
+    message_expiry = config.get('message_expiry')
+    if not content_type and not message_expiry:
+        return None
+    properties = Properties(PacketTypes.PUBLISH)
+    if content_type:
+        properties.ContentType = content_type
+    if message_expiry:
+        properties.MessageExpiryInterval = int(message_expiry)
+    return properties
+
+def create_publisher(client, config, properties=None, keep_undelivered=False):
+    """create the publisher of a configuration set for one run"""
+    return Publisher(client,
+                     qos=int(config.get('qos', 0)),
+                     retain=bool(config.get('retain', False)),
+                     batch_size=config.get('batch_size') or DEFAULT_BATCH_SIZE,
+                     max_inflight=config.get('max_inflight') or DEFAULT_MAX_INFLIGHT,
+                     ack_timeout=config.get('ack_timeout') or DEFAULT_ACK_TIMEOUT,
+                     wait_for_ack=config.get('wait_for_ack', True),
+                     properties=properties,
+                     keep_undelivered=keep_undelivered)
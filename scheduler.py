@@ -0,0 +1,138 @@
+"""priority queue scheduler for the configuration sets"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from logger import log
+
+OVERRUN_POLICIES = ['skip', 'coalesce']
+
+class Job:
+    """a configuration set scheduled on a fixed grid of time slots"""
+    def __init__(self, name, interval=None, splay=0, jitter=0, overrun='skip'):
+        self.name = name
+        self.interval = interval
+        self.splay = splay or 0
+        self.jitter = jitter or 0
+        self.overrun = overrun if overrun in OVERRUN_POLICIES else 'skip'
+        self.slot = None        # start of the current time slot, without jitter
+        self.due = None         # time the last popped run was due
+        self.running = False    # a run of this job is in progress
+        self.pending = False    # a coalesced run is waiting for the current one
+        self.removed = False
+
+class Scheduler:
+    """sleeps until the next job is due instead of polling all jobs"""
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._jobs = {}
+        self._cond = threading.Condition()
+
+    def _push(self, due, job, catchup=False):
+        """queue a run of job at due, the caller holds the lock"""
+        heapq.heappush(self._heap, (due, next(self._counter), job, catchup))
+        self._cond.notify()
+
+    def _due_time(self, job):
+        """time the current slot of job fires, including the random jitter"""
+        if job.jitter:
+            return job.slot + random.uniform(0, job.jitter)
+        return job.slot
+
+    def add(self, job, start=None):
+        """schedule a job, the first run is one interval (plus splay) from start"""
+        start = time.time() if start is None else start
+        with self._cond:
+            old_job = self._jobs.get(job.name)
+            if old_job is not None:
+                old_job.removed = True
+            self._jobs[job.name] = job
+            job.slot = start + (job.interval or 0)
+            if job.splay:
+                # spread jobs with the same interval over the splay window
+                job.slot += random.uniform(0, job.splay)
+            self._push(self._due_time(job), job)
+        return job
+
+    def remove(self, name):
+        """unschedule the job with the given name"""
+        with self._cond:
+            job = self._jobs.pop(name, None)
+            if job is not None:
+                job.removed = True
+            return job
+
+    def get(self, name):
+        """return the scheduled job with the given name"""
+        return self._jobs.get(name)
+
+    def jobs(self):
+        """return all scheduled jobs"""
+        return list(self._jobs.values())
+
+    def set_interval(self, job, interval):
+        """change the interval of job, effective from its next slot"""
+        with self._cond:
+            job.interval = interval
+
+    def run_now(self, job):
+        """queue an extra run of job that does not move its time slots"""
+        with self._cond:
+            if not job.removed:
+                self._push(time.time(), job, catchup=True)
+
+    def _advance(self, job, now):
+        """move job to its next slot on the grid, skipping slots already missed"""
+        next_slot = job.slot + job.interval
+        if next_slot <= now:
+            missed = int((now - next_slot) // job.interval) + 1
+            log(f"Config {job.name} is {missed} interval(s) behind schedule, " \
+                "skipping missed runs", 2)
+            next_slot += missed * job.interval
+        job.slot = next_slot
+        self._push(self._due_time(job), job)
+
+    def pop_due(self, now=None):
+        """return all jobs that are due and schedule their next slot"""
+        now = time.time() if now is None else now
+        due_jobs = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job, catchup = heapq.heappop(self._heap)
+                if job.removed:
+                    continue
+                job.due = due
+                if job.interval and not catchup:
+                    self._advance(job, now)
+                elif not job.interval and not catchup:
+                    # one-shot jobs are done after their only run
+                    self._jobs.pop(job.name, None)
+                due_jobs.append(job)
+        return due_jobs
+
+    def next_due(self):
+        """time of the next due job, or None if nothing is scheduled"""
+        with self._cond:
+            while self._heap and self._heap[0][2].removed:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def wait(self, max_wait=None):
+        """sleep until the next job is due or the scheduler is woken up"""
+        with self._cond:
+            next_due = self.next_due()
+            if next_due is None:
+                timeout = max_wait
+            else:
+                timeout = max(0, next_due - time.time())
+                if max_wait is not None:
+                    timeout = min(timeout, max_wait)
+            if timeout is None or timeout > 0:
+                self._cond.wait(timeout)
+
+    def wake(self):
+        """interrupt a pending wait"""
+        with self._cond:
+            self._cond.notify_all()
@@ -0,0 +1,63 @@
+"""fetch and parse a URL once for all configuration sets that point at it"""
+import threading
+import time
+from concurrent.futures import Future
+from logger import log
+
+class SharedResponse:
+    """a fetched document and its parsed forms, shared read-only between configuration sets"""
+    def __init__(self, content_type, text):
+        self.content_type = content_type
+        self.text = text
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def parse(self, data_format, backend, parse):
+        """parse the document once per format and backend"""
+        key = (data_format, backend)
+        with self._lock:
+            if key not in self._parsed:
+                self._parsed[key] = parse(self.text)
+            return self._parsed[key]
+
+class SharedFetches:
+    """single-flight fetches with a short-lived cache of the responses"""
+    def __init__(self):
+        self._cache = {}     # key -> (expiry time, response)
+        self._inflight = {}  # key -> Future of the running fetch
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl, load):
+        """return the response of key, running load only if nobody else is doing so"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                log("Using the shared response of %s", 4, key[0])
+                return entry[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            log("Waiting for the shared fetch of %s", 4, key[0])
+            return future.result()
+        try:
+            response = load()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if ttl:
+                # expired entries are dropped whenever a new one is stored
+                now = time.monotonic()
+                self._cache = {cached_key: cached for cached_key, cached in self._cache.items()
+                               if cached[0] > now}
+                self._cache[key] = (now + ttl, response)
+        future.set_result(response)
+        return response
+
+shared_fetches = SharedFetches()
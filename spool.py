@@ -0,0 +1,184 @@
+"""on-disk store-and-forward buffer for messages that cannot be published"""
+import base64
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from logger import log
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_AGE = 24 * 3600
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+DEFAULT_REPLAY_RATE = 100
+SEGMENT_SUFFIX = '.seg'
+
+def _encode(timestamp, topic, payload):
+    """one spool record as a JSON line, binary payloads are base64 encoded"""
+    if isinstance(payload, (bytes, bytearray)):
+        record = [timestamp, topic, base64.b64encode(payload).decode('ascii'), True]
+    else:
+        record = [timestamp, topic, payload, False]
+    return (json.dumps(record, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+
+def _decode(line):
+    """(timestamp, topic, payload) of a spool record"""
+    timestamp, topic, payload, binary = json.loads(line)
+    return timestamp, topic, base64.b64decode(payload) if binary else payload
+
+class Spool:
+    """append-only segment files of the messages of one configuration set"""
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 segment_bytes=DEFAULT_SEGMENT_BYTES, replay_rate=DEFAULT_REPLAY_RATE,
+                 compact=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segment_bytes = segment_bytes
+        self.replay_rate = replay_rate
+        self.compact = compact
+        self._buffer = []
+        os.makedirs(directory, exist_ok=True)
+        self._next_segment = max(self._segment_numbers(), default=0) + 1
+
+    def _segment_numbers(self):
+        """numbers of the segment files on disk, oldest first"""
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _path(self, number):
+        """path of a segment file"""
+        return os.path.join(self.directory, f"{number:012d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        """paths of the segment files, oldest first"""
+        return [self._path(number) for number in self._segment_numbers()]
+
+    def publish(self, topic, payload):
+        """buffer a message, it is written to disk by flush"""
+        self._buffer.append(_encode(time.time(), topic, payload))
+
+    def _write_segments(self, records, append=False):
+        """write records to segments of at most segment_bytes, continuing the newest one"""
+        path, size = None, 0
+        numbers = self._segment_numbers() if append else []
+        if numbers:
+            path = self._path(numbers[-1])
+            size = os.path.getsize(path)
+        file = None
+        try:
+            for record in records:
+                if file is None or size >= self.segment_bytes:
+                    if file is not None:
+                        self._close_segment(file)
+                    if path is None or size >= self.segment_bytes:
+                        path, size = self._path(self._next_segment), 0
+                        self._next_segment += 1
+                    file = open(path, 'ab')
+                file.write(record)
+                size += len(record)
+        finally:
+            if file is not None:
+                self._close_segment(file)
+
+    @staticmethod
+    def _close_segment(file):
+        """make the written records durable"""
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+
+    def flush(self):
+        """write the buffered messages to disk and enforce the limits, returns their number"""
+        count = len(self._buffer)
+        if self._buffer:
+            self._write_segments(self._buffer, append=True)
+            self._buffer = []
+            self._enforce_limits()
+        return count
+
+    def _read(self, paths):
+        """yield the records of the given segments that are not expired"""
+        oldest = time.time() - self.max_age if self.max_age else None
+        for path in paths:
+            with open(path, 'rb') as file:
+                for line in file:
+                    try:
+                        record = _decode(line)
+                    except (ValueError, TypeError):
+                        log(f"Skipping a corrupt record in spool segment {path}", 1)
+                        continue
+                    if oldest is None or record[0] >= oldest:
+                        yield record
+
+    def _compacted(self, paths):
+        """the latest record of every topic, in the order the records were written"""
+        latest = OrderedDict()
+        for timestamp, topic, payload in self._read(paths):
+            latest.pop(topic, None)
+            latest[topic] = (timestamp, topic, payload)
+        return list(latest.values())
+
+    def _enforce_limits(self):
+        """drop expired segments, compact and finally drop the oldest data to stay in size"""
+        paths = self.segments()
+        if self.max_age:
+            oldest = time.time() - self.max_age
+            for path in paths:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+            paths = self.segments()
+        if not self.max_bytes or sum(os.path.getsize(path) for path in paths) <= self.max_bytes:
+            return
+        if self.compact and len(paths) > 1:
+            records = self._compacted(paths)
+            self._write_segments(_encode(*record) for record in records)
+            for path in paths:
+                os.remove(path)
+            log(f"Spool {self.directory} compacted to {len(records)} messages", 3)
+            paths = self.segments()
+        dropped = 0
+        while len(paths) > 1 and sum(os.path.getsize(path) for path in paths) > self.max_bytes:
+            os.remove(paths.pop(0))
+            dropped += 1
+        if dropped:
+            log(f"Spool {self.directory} is full, dropped the {dropped} oldest segment(s)", 1)
+
+    def replay(self, publisher):
+        """publish the spooled messages at the replay rate, returns the number sent"""
+        paths = self.segments()
+        if not paths:
+            return 0
+        records = self._compacted(paths) if self.compact else list(self._read(paths))
+        log(f"Replaying {len(records)} spooled messages from {self.directory}", 2)
+        start = time.monotonic()
+        for count, (_, topic, payload) in enumerate(records):
+            if self.replay_rate:
+                delay = start + count / self.replay_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            publisher.publish(topic, payload)
+        return len(records)
+
+    def clear(self):
+        """remove the segment files after a successful replay"""
+        for path in self.segments():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def spool_directory(base_directory, name):
+    """directory of the spool of a configuration set"""
+    return os.path.join(base_directory, re.sub(r'[^\w.-]', '_', str(name)))
+
+def create_spool(config):
+    """create the spool of a configuration set, None if spooling is off"""
+    if not config.get('spool'):
+        return None
+    return Spool(spool_directory(config['spool'], config.get('name', "commandline")),
+                 config.get('spool_max_bytes') or DEFAULT_MAX_BYTES,
+                 config.get('spool_max_age', DEFAULT_MAX_AGE),
+                 config.get('spool_segment_bytes') or DEFAULT_SEGMENT_BYTES,
+                 config.get('spool_replay_rate', DEFAULT_REPLAY_RATE),
+                 config.get('spool_compact', True))
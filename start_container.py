@@ -2,8 +2,6 @@ import os
 import subprocess
 import sys
 import time
-import hashlib
-import random
 from logger import log
 
 # Funktion, um eine Fehlermeldung auszugeben und das Skript zu beenden
@@ -21,21 +19,15 @@ def print_config_file(cfgfile):
     else:
         log(f"WARNING: {cfgfile} does not exist.", 1)
 
-# Funktion, um die Checksumme einer Datei zu berechnen
-def calculate_checksum(cfgfile):
-    if not os.path.isfile(cfgfile):
-        return None
-    
-    hasher = hashlib.md5()
-    with open(cfgfile, 'rb') as file:
-        buf = file.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
-
 # Funktion, um den data2mqtt-Prozess zu starten
+# (data2mqtt.py lädt die Konfigurationsdatei bei Änderungen selbst neu)
 def start_data2mqtt(cfgfile):
     try:
-        process = subprocess.Popen(["python", "data2mqtt.py", "--configfile", cfgfile])
+        command = ["python", "data2mqtt.py", "--configfile", cfgfile, "--watch"]
+        # Mit WORKERS > 1 verteilt data2mqtt.py die Konfigurationssätze auf mehrere Prozesse
+        if workers and int(workers) > 1:
+            command += ["--workers", workers]
+        process = subprocess.Popen(command)
         log("data2mqtt.py started successfully", 1)
         return process
     except Exception as e:
@@ -52,6 +44,7 @@ def stop_data2mqtt(process):
 loglevel = os.getenv("LOGLEVEL", "1")
 webport = os.getenv("WEBPORT", "8833")
 cfgfile = os.getenv("CFGFILE", "/opt/config.yaml")
+workers = os.getenv("WORKERS", "")
 
 # Setze die Umgebungsvariablen, falls sie nicht gesetzt sind
 os.environ["LOGLEVEL"] = loglevel
@@ -59,14 +52,12 @@ os.environ["WEBPORT"] = webport
 os.environ["CFGFILE"] = cfgfile
 
 # Debugging-Ausgabe für Umgebungsvariablen
-log(f"Starting with LOGLEVEL={loglevel}, WEBPORT={webport}, CFGFILE={cfgfile}", 1)
+log(f"Starting with LOGLEVEL={loglevel}, WEBPORT={webport}, CFGFILE={cfgfile}, " \
+    f"WORKERS={workers or 1}", 1)
 
 # Gebe die Konfigurationsdatei beim Start aus
 print_config_file(cfgfile)
 
-# Initiale Checksumme berechnen
-previous_checksum = calculate_checksum(cfgfile)
-
 # Starte data2mqtt.py im Hintergrund
 data2mqtt_process = start_data2mqtt(cfgfile)
 
@@ -78,27 +69,13 @@ except Exception as e:
     log_error(f"Failed to start configeditor.py: {e}")
 
 try:
-    # Überprüfe alle 5 Sekunden, ob sich die Konfigurationsdatei geändert hat
+    # Überprüfe alle 5 Sekunden, ob data2mqtt.py noch läuft, und starte es bei Bedarf neu
     while True:
         time.sleep(5)
-        
-        # Füge eine zufällige Wartezeit von 100-900 ms hinzu
-        random_wait_time = random.uniform(0.1, 0.9)
-        time.sleep(random_wait_time)
-        
-        current_checksum = calculate_checksum(cfgfile)
-        if current_checksum != previous_checksum:
-            log(f"{cfgfile} has been modified.", 1)
-            print_config_file(cfgfile)
-            
-            # Beende den aktuellen data2mqtt-Prozess
-            stop_data2mqtt(data2mqtt_process)
-            
-            # Starte data2mqtt.py neu
+
+        if data2mqtt_process is None or data2mqtt_process.poll() is not None:
+            log("data2mqtt.py is not running, restarting it.", 1)
             data2mqtt_process = start_data2mqtt(cfgfile)
-            
-            # Aktualisiere die Checksumme
-            previous_checksum = current_checksum
 
 except KeyboardInterrupt:
     log("Shutting down container.", 1)
@@ -0,0 +1,94 @@
+"""streaming parsers emitting data points while the payload is being read"""
+import csv
+import io
+import xml.etree.ElementTree as ElementTree
+from logger import log
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+STREAMING_FORMATS = ['json', 'xml', 'csv']
+
+def can_stream(data_format):
+    """True if data_format can be parsed incrementally"""
+    if data_format == 'json' and ijson is None:
+        log("ijson is not installed, JSON data is not streamed", 3)
+        return False
+    return data_format in STREAMING_FORMATS
+
+def stream_json(fileobj, separator='.'):
+    """yield (key, value) for every leaf of a JSON document read from a binary file"""
+    path = []
+    indexes = []  # element counter of every open array, None for objects
+    # numbers are floats as with the other JSON parsers, not Decimal
+    for _, event, value in ijson.parse(fileobj, use_float=True):
+        if event == 'map_key':
+            path[-1] = value
+            continue
+        if event in ('end_map', 'end_array'):
+            path.pop()
+            indexes.pop()
+            continue
+        if indexes and indexes[-1] is not None:
+            path[-1] = str(indexes[-1])
+            indexes[-1] += 1
+        if event == 'start_map':
+            path.append(None)
+            indexes.append(None)
+        elif event == 'start_array':
+            path.append(None)
+            indexes.append(0)
+        else:
+            yield separator.join(path), value
+
+def _local_name(tag):
+    """strip the namespace from an element tag"""
+    return tag.rsplit('}', 1)[-1]
+
+def stream_xml(fileobj, separator='.'):
+    """yield (key, value) for every attribute and text of an XML document"""
+    path = []
+    stack = []  # [element, has_children] of every open element
+    for event, element in ElementTree.iterparse(fileobj, events=('start', 'end')):
+        if event == 'start':
+            if stack:
+                stack[-1][1] = True
+            path.append(_local_name(element.tag))
+            stack.append([element, False])
+            key = separator.join(path)
+            for name, value in element.attrib.items():
+                yield f"{key}{separator}@{_local_name(name)}", value
+            continue
+        _, has_children = stack.pop()
+        text = (element.text or '').strip()
+        if text:
+            key = separator.join(path)
+            if has_children or element.attrib:
+                key = f"{key}{separator}#text"
+            yield key, text
+        path.pop()
+        # drop everything that has been processed to keep the memory bounded
+        element.clear()
+        if stack:
+            del stack[-1][0][:]
+
+def stream_csv(fileobj, encoding='utf-8', layout=None):
+    """yield (column, value) for every cell of a CSV file, row by row or chunk by chunk"""
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+    if layout is not None:
+        yield from layout.cells(text)
+        return
+    for row in csv.DictReader(text):
+        yield from row.items()
+
+def stream_data(fileobj, data_format, encoding=None, csv_layout=None, separator='.'):
+    """yield the (key, value) pairs of a binary file object in the given format"""
+    if data_format == 'json':
+        return stream_json(fileobj, separator)
+    if data_format == 'xml':
+        return stream_xml(fileobj, separator)
+    if data_format == 'csv':
+        return stream_csv(fileobj, encoding or 'utf-8', csv_layout)
+    raise ValueError(f"Streaming is not supported for {data_format} data")
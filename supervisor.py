@@ -0,0 +1,133 @@
+"""multi-process mode: configuration sets sharded across worker processes"""
+import bisect
+import hashlib
+import signal
+import subprocess
+import sys
+import time
+from logger import log
+
+RING_REPLICAS = 100
+MIN_RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+
+def _hash(key):
+    """stable hash of a string, the same in every process"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+    """consistent hashing of configuration set names onto worker indexes"""
+    def __init__(self, workers, replicas=RING_REPLICAS):
+        points = sorted((_hash(f"worker-{worker}-{replica}"), worker)
+                        for worker in range(workers) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._workers = [worker for _, worker in points]
+
+    def worker_of(self, name):
+        """index of the worker responsible for name"""
+        index = bisect.bisect(self._hashes, _hash(name)) % len(self._hashes)
+        return self._workers[index]
+
+def parse_shard(shard):
+    """parse 'index/count' into a tuple of ints"""
+    index, count = shard.split('/', 1)
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{shard}'")
+    return index, count
+
+class ShardFilter:
+    """decides which configuration sets belong to this worker"""
+    def __init__(self, shard):
+        self.index, self.count = parse_shard(shard)
+        self.ring = HashRing(self.count)
+
+    def __call__(self, config):
+        """True if config is handled by this worker"""
+        return self.ring.worker_of(str(config.get('name'))) == self.index
+
+def worker_arguments(argv):
+    """strip the --workers option from the commandline of the supervisor"""
+    arguments = []
+    skip_next = False
+    for argument in argv:
+        if skip_next:
+            skip_next = False
+        elif argument == '--workers':
+            skip_next = True
+        elif not argument.startswith('--workers='):
+            arguments.append(argument)
+    return arguments
+
+class Worker:
+    """a worker process and its restart bookkeeping"""
+    def __init__(self, index, command):
+        self.index = index
+        self.command = command
+        self.process = None
+        self.restart_delay = MIN_RESTART_DELAY
+        self.restart_at = 0
+        self.started_at = 0
+
+    def start(self):
+        """start the worker process"""
+        self.process = subprocess.Popen(self.command)
+        self.started_at = time.monotonic()
+        log(f"Worker {self.index} started with pid {self.process.pid}", 1)
+
+class Supervisor:
+    """starts one data2mqtt process per shard and restarts crashed workers individually"""
+    def __init__(self, script, argv, workers):
+        arguments = worker_arguments(argv)
+        self.workers = [Worker(index, [sys.executable, script, *arguments,
+                                       '--shard', f"{index}/{workers}"])
+                        for index in range(workers)]
+        self._stopping = False
+
+    def _forward(self, signum, _frame=None):
+        """pass a signal on to all running workers"""
+        for worker in self.workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.send_signal(signum)
+
+    def _check(self, worker):
+        """restart a worker that exited, backing off if it keeps crashing"""
+        now = time.monotonic()
+        if worker.process is not None:
+            returncode = worker.process.poll()
+            if returncode is None:
+                return
+            # workers that ran for a while start over with the shortest delay
+            if now - worker.started_at > MAX_RESTART_DELAY:
+                worker.restart_delay = MIN_RESTART_DELAY
+            log(f"Worker {worker.index} exited with code {returncode}, restarting " \
+                f"in {worker.restart_delay} seconds", 1)
+            worker.process = None
+            worker.restart_at = now + worker.restart_delay
+            worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+        if now >= worker.restart_at:
+            worker.start()
+
+    def run(self):
+        """run the workers until interrupted"""
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._forward)
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        for worker in self.workers:
+            worker.start()
+        while not self._stopping:
+            time.sleep(1)
+            for worker in self.workers:
+                if not self._stopping:
+                    self._check(worker)
+
+    def stop(self):
+        """terminate all workers"""
+        self._stopping = True
+        for worker in self.workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.wait()
+        log("All workers stopped.", 1)
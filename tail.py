@@ -0,0 +1,163 @@
+"""incremental reading of local files that grow by appended records"""
+import mmap
+import os
+from logger import log
+from pagination import cursor_store
+
+TAIL_FORMATS = ['json', 'ndjson', 'csv']
+TAIL_STARTS = ['beginning', 'end']
+MMAP_THRESHOLD = 1024 * 1024
+END_BLOCK = 65536
+
+class FileTail:
+    """remembers the file and the byte offset up to which a growing file has been read"""
+    def __init__(self, start='beginning', use_mmap=False, name=None, store=None):
+        self.start = start if start in TAIL_STARTS else 'beginning'
+        self.use_mmap = use_mmap
+        self.name = name
+        self.store = store  # keeps the position across restarts
+        self.file = None
+        self.identity = None
+        self.offset = 0
+        self.header = b''  # first line of the file, the header of CSV files
+        self.rows = 0      # lines read after the header, the index of the next CSV row
+
+    def _size(self):
+        """current size of the open file"""
+        return os.fstat(self.file.fileno()).st_size
+
+    def _end_offset(self, size):
+        """offset just after the last complete line of the file"""
+        start = max(0, size - END_BLOCK)
+        self.file.seek(start)
+        block = self.file.read(size - start)
+        newline = block.rfind(b'\n')
+        return start + newline + 1 if newline >= 0 else size
+
+    def _count_lines(self, start, end):
+        """number of lines between two offsets of the file"""
+        self.file.seek(start)
+        lines = 0
+        while start < end:
+            block = self.file.read(min(MMAP_THRESHOLD, end - start))
+            if not block:
+                break
+            lines += block.count(b'\n')
+            start += len(block)
+        return lines
+
+    def _open(self, path, first=False):
+        """open path, a file found on the first run may be read from its end"""
+        self.file = open(path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.offset = 0
+        self.header = b''
+        self.rows = 0
+        if first and self.start == 'end' and stat.st_size:
+            self.header = self.file.readline()
+            self.offset = max(self._end_offset(stat.st_size), len(self.header))
+            # rows keep their index even though they are skipped
+            self.rows = self._count_lines(len(self.header), self.offset)
+
+    def _restore(self, path):
+        """continue at the position saved by an earlier process, False if there is none"""
+        saved = self.store.load(self.name) if self.store is not None else None
+        if not saved:
+            return False
+        self._open(path)
+        if list(self.identity) != saved.get('identity'):
+            log(f"File {path} was replaced while stopped, reading it from the beginning", 2)
+            return True
+        self.offset = saved.get('offset', 0)
+        self.rows = saved.get('rows', 0)
+        if self.offset:
+            self.header = self.file.readline()
+        return True
+
+    def save(self):
+        """store the position, so a restart continues where this process stopped"""
+        if self.store is None or self.file is None:
+            return
+        try:
+            self.store.save(self.name, {'identity': list(self.identity), 'offset': self.offset,
+                                        'rows': self.rows})
+        except OSError as e:
+            log(f"Error saving tail state file {self.store.path}: {e}", 1)
+
+    def _rewritten(self):
+        """True if the file no longer continues what has been read, e.g. after truncation"""
+        if self.offset == 0:
+            return False
+        if self._size() < self.offset:
+            return True
+        if self.header:
+            self.file.seek(0)
+            if self.file.read(len(self.header)) != self.header:
+                return True
+        # the offset always follows a complete line
+        self.file.seek(self.offset - 1)
+        return self.file.read(1) != b'\n'
+
+    def _read_lines(self, size):
+        """read the complete lines between the offset and size"""
+        if size <= self.offset:
+            return b''
+        if self.use_mmap and size - self.offset >= MMAP_THRESHOLD:
+            with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                end = mapped.rfind(b'\n', self.offset, size) + 1
+                data = mapped[self.offset:end] if end > self.offset else b''
+        else:
+            self.file.seek(self.offset)
+            data = self.file.read(size - self.offset)
+            # a partial last line is read again once it is complete
+            data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        return data
+
+    def _chunk(self):
+        """return (header, data, first row) of the new lines, no header at the file start"""
+        from_start = self.offset == 0
+        data = self._read_lines(self._size())
+        if not data:
+            return None
+        first_row = self.rows
+        if from_start:
+            self.header = data[:data.find(b'\n') + 1]
+            self.rows += data.count(b'\n') - 1
+            return b'', data, first_row
+        self.rows += data.count(b'\n')
+        return self.header, data, first_row
+
+    def read(self, path):
+        """return the (header, data, first row) chunks appended to path since the last call"""
+        if self.file is None and not self._restore(path):
+            self._open(path, first=True)
+        chunks = []
+        stat = os.stat(path)
+        if (stat.st_dev, stat.st_ino) != self.identity:
+            # rotated: finish the old file, then start the new one from the beginning
+            chunks.append(self._chunk())
+            log(f"File {path} was rotated, reading the new file from the beginning", 2)
+            self.file.close()
+            self._open(path)
+        elif self._rewritten():
+            log(f"File {path} was truncated or rewritten, reading it from the beginning", 2)
+            self.offset = 0
+            self.rows = 0
+        chunks.append(self._chunk())
+        return [chunk for chunk in chunks if chunk is not None]
+
+    def close(self):
+        """close the file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def create_tail(config):
+    """create the tail of a configuration set, None if tail mode is off"""
+    if not config.get('tail'):
+        return None
+    store = cursor_store(config['tail_state_file']) if config.get('tail_state_file') else None
+    return FileTail(config.get('tail_start', 'beginning'), bool(config.get('tail_mmap')),
+                    config.get('name', "commandline"), store)
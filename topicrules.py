@@ -0,0 +1,192 @@
+"""per-config rules filtering, renaming and transforming the published data points"""
+import re
+
+DEFAULT_SEPARATOR = '.'
+MAX_CACHED_KEYS = 10000
+RULE_KEYS = ['include', 'exclude', 'rename', 'transforms']
+
+_NUMBER_WITH_UNIT = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*[^\d\s]*\s*$')
+
+def _as_list(value, what):
+    """accept a single pattern or a list of patterns"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return value
+    raise ValueError(f"'{what}' must be a pattern or a list of patterns")
+
+def _glob_regex(pattern, separator):
+    """translate a glob on key paths, '*' stays within one level, '**' spans levels"""
+    other = f"[^{re.escape(separator)}]"
+    parts = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith('**', index):
+            parts.append('.*')
+            index += 2
+        elif pattern[index] == '*':
+            parts.append(f"{other}*")
+            index += 1
+        elif pattern[index] == '?':
+            parts.append(other)
+            index += 1
+        else:
+            parts.append(re.escape(pattern[index]))
+            index += 1
+    return ''.join(parts)
+
+def compile_globs(patterns, separator):
+    """compile a list of globs into one regex, None if the list is empty"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(f"(?:{_glob_regex(pattern, separator)})"
+                               for pattern in patterns))
+
+def _is_number(value):
+    """True for ints and floats, but not for booleans"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _strip_unit(value):
+    """turn '21.5 °C' into 21.5, other values are returned unchanged"""
+    if not isinstance(value, str):
+        return value
+    match = _NUMBER_WITH_UNIT.match(value)
+    if match is None:
+        return value
+    number = match.group(1)
+    if any(char in number for char in '.eE'):
+        return float(number)
+    return int(number)
+
+def compile_transform(spec):
+    """build the value transform of a transform rule once"""
+    steps = []
+    if spec.get('strip_unit'):
+        steps.append(_strip_unit)
+    scale = spec.get('scale')
+    if scale is not None:
+        steps.append(lambda value: value * scale if _is_number(value) else value)
+    offset = spec.get('offset')
+    if offset is not None:
+        steps.append(lambda value: value + offset if _is_number(value) else value)
+    digits = spec.get('round')
+    if digits is not None:
+        digits = int(digits)
+        if digits > 0:
+            steps.append(lambda value: round(value, digits) if _is_number(value) else value)
+        else:
+            steps.append(lambda value: int(round(value, digits)) if _is_number(value) else value)
+    if not steps:
+        return None
+    if len(steps) == 1:
+        return steps[0]
+
+    def transform(value):
+        for step in steps:
+            value = step(value)
+        return value
+    return transform
+
+class RenameTrie:
+    """longest-prefix renaming of key paths, level by level"""
+    def __init__(self, renames, separator):
+        self.separator = separator
+        self.root = {}
+        for old, new in renames.items():
+            node = self.root
+            for level in str(old).split(separator):
+                node = node.setdefault(level, {})
+            node[None] = str(new)
+
+    def rename(self, key):
+        """replace the longest renamed prefix of key"""
+        levels = key.split(self.separator)
+        node = self.root
+        found = None
+        for depth, level in enumerate(levels, 1):
+            node = node.get(level)
+            if node is None:
+                break
+            if None in node:
+                found = (depth, node[None])
+        if found is None:
+            return key
+        depth, new = found
+        rest = levels[depth:]
+        return self.separator.join([new, *rest]) if new else self.separator.join(rest)
+
+class TopicRules:
+    """rules of a configuration set, compiled once and cached per key"""
+    def __init__(self, spec, separator=DEFAULT_SEPARATOR):
+        self.spec = spec
+        self.separator = separator
+        self.include = compile_globs(_as_list(spec.get('include'), 'include'), separator)
+        self.exclude = compile_globs(_as_list(spec.get('exclude'), 'exclude'), separator)
+        renames = spec.get('rename') or {}
+        if not isinstance(renames, dict):
+            raise ValueError("'rename' must map old keys to new keys")
+        self.renames = RenameTrie(renames, separator) if renames else None
+        self.transforms = []
+        for transform_spec in spec.get('transforms') or []:
+            if not isinstance(transform_spec, dict) or 'match' not in transform_spec:
+                raise ValueError("every transform needs a 'match' pattern")
+            patterns = _as_list(transform_spec['match'], 'match')
+            self.transforms.append((compile_globs(patterns, separator),
+                                    compile_transform(transform_spec)))
+        self._cache = {}
+
+    def __reduce__(self):
+        # the compiled matchers and transforms are rebuilt from the spec when unpickled
+        return (TopicRules, (self.spec, self.separator))
+
+    def __eq__(self, other):
+        return isinstance(other, TopicRules) and \
+            (self.spec, self.separator) == (other.spec, other.separator)
+
+    def _resolve(self, key):
+        """decide about a key that is not cached yet"""
+        if self.include is not None and not self.include.fullmatch(key):
+            return None
+        if self.exclude is not None and self.exclude.fullmatch(key):
+            return None
+        transform = None
+        for matcher, candidate in self.transforms:
+            if matcher.fullmatch(key):
+                transform = candidate
+                break
+        topic = self.renames.rename(key) if self.renames is not None else key
+        return topic, transform
+
+    def resolve(self, key):
+        """return (topic, transform) of a key, None if the key is dropped"""
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        result = self._resolve(key)
+        if len(self._cache) >= MAX_CACHED_KEYS:
+            self._cache.clear()
+        self._cache[key] = result
+        return result
+
+    def apply(self, pairs):
+        """filter, rename and transform (key, value) pairs"""
+        for key, value in pairs:
+            target = self.resolve(key)
+            if target is not None:
+                topic, transform = target
+                yield topic, transform(value) if transform is not None else value
+
+def compile_rules(config):
+    """compile the rules of a configuration set, None if it has none"""
+    spec = config.get('rules')
+    if not spec:
+        return None
+    if not isinstance(spec, dict):
+        raise ValueError("'rules' must be a mapping")
+    unknown = set(spec) - set(RULE_KEYS)
+    if unknown:
+        raise ValueError(f"unknown rule(s) {sorted(unknown)}")
+    return TopicRules(spec, config.get('topic_separator') or DEFAULT_SEPARATOR)